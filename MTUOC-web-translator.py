@@ -1,176 +1,70 @@
 import streamlit as st
-import pyperclip 
-import sys
-import random
-import requests
-import yaml
 import tempfile
 import os
-import pathlib
+import html
 from pathlib import Path
-import shutil
-
-import json
-import ast
-
-
-from TextBox_translator import translate_segment
-
-from MTUOC_tikal_translate import Tikal
-
-from MTUOC_cleanDOCX import DocxCleaner
-from MTUOC_cleanODT import OdtCleaner
-
-import platform
-
-
-# Función auxiliar para intentar abrir un DOCX
-def is_valid_docx(filepath):
-    try:
-        Document(filepath)
-        return True
-    except Exception:
-        return False
-
-# Función auxiliar para intentar abrir un ODT
-def is_valid_odt(filepath):
-    try:
-        with zipfile.ZipFile(filepath, 'r') as odt_zip:
-            if 'content.xml' in odt_zip.namelist():
-                return True
-            else:
-                return False
-    except Exception:
-        return False
-
-# Función auxiliar para eliminar todo formato de un DOCX y dejar sólo texto plano
-def remove_formatting_docx(input_path, output_path):
-    doc_in = Document(input_path)
-    doc_out = Document()
-    for para in doc_in.paragraphs:
-        doc_out.add_paragraph(para.text)
-    doc_out.save(output_path)
-
-# Función auxiliar para eliminar todo formato de un ODT y dejar sólo texto plano
-def remove_formatting_odt(input_path, output_path):
-    # Método simple: convertir ODT -> TXT plano (si quieres hacer algo más complejo avísame)
-    with zipfile.ZipFile(input_path, 'r') as zin:
-        zin.extract('content.xml', path='.')
-    with open('content.xml', 'r', encoding='utf-8') as f:
-        content = f.read()
-    # Eliminar etiquetas XML
-    import re
-    text = re.sub(r'<[^>]+>', '', content)
-    # Crear nuevo ODT mínimo
-    from odf.opendocument import OpenDocumentText
-    from odf.text import P
-
-    newdoc = OpenDocumentText()
-    p = P(text=text)
-    newdoc.text.addElement(p)
-    newdoc.save(output_path)
-    os.remove('content.xml')
-
-def translate_file():
-    filepath = file_path_entry.get()
-    if not filepath or not os.path.exists(filepath):
-        messagebox.showinfo("Error", "Please select a valid file path.")
-        return
-
-    filedir = os.path.dirname(filepath)
-    filename = os.path.splitext(os.path.basename(filepath))[0]
-    filextension = os.path.splitext(filepath)[1].lower()
-
-    if filextension == ".docx":
-        print("DOCX")
-        shutil.copy(filepath, "tempfile.docx")
-
-        cleaner = DocxCleaner()
-        cleaner.clean_docx("tempfile.docx", "tempfile.clean.docx")
-
-        traductor.translate("tempfile.clean.docx")
-
-        if not is_valid_docx("tempfile.clean.out.docx"):
-            print("Translated DOCX is invalid. Removing formatting and retrying...")
-            remove_formatting_docx("tempfile.docx", "tempfile.nofmt.docx")
-            cleaner.clean_docx("tempfile.nofmt.docx", "tempfile.clean.docx")
-            traductor.translate("tempfile.clean.docx")
-
-        outname = filename + ".out" + filextension
-        outpath = os.path.join(filedir, outname)
-        shutil.copy("tempfile.clean.out.docx", outpath)
-
-        for temp_file in [
-            "tempfile.docx", "tempfile.clean.docx", "tempfile.clean.out.docx", "tempfile.nofmt.docx"
-        ]:
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
-
-    elif filextension in [".odt", ".odf"]:
-        print("ODT")
-        shutil.copy(filepath, "tempfile.odt")
-
-        cleaner = OdtCleaner()
-        cleaner.clean_odt("tempfile.odt", "tempfile.clean.odt")
-
-        traductor.translate("tempfile.clean.odt")
-
-        if not is_valid_odt("tempfile.clean.out.odt"):
-            print("Translated ODT is invalid. Removing formatting and retrying...")
-            remove_formatting_odt("tempfile.odt", "tempfile.nofmt.odt")
-            cleaner.clean_odt("tempfile.nofmt.odt", "tempfile.clean.odt")
-            traductor.translate("tempfile.clean.odt")
-
-        outname = filename + ".out" + filextension
-        outpath = os.path.join(filedir, outname)
-        shutil.copy("tempfile.clean.out.odt", outpath)
-
-        for temp_file in [
-            "tempfile.odt", "tempfile.clean.odt", "tempfile.clean.out.odt", "tempfile.nofmt.odt"
-        ]:
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
-
-    else:
-        traductor.translate(filepath)
 
+from MTUOC_engines import load_engines
+from MTUOC_file_translator import translate_file, output_name
+from MTUOC_metrics import metrics
+from MTUOC_package import save_upload, MemoryBudgetExceeded
+from MTUOC_document_cache import DocumentCache
+from MTUOC_scheduler import scheduling, scheduler_summary, INTERACTIVE
+from MTUOC_admission import QueueFull, document_queue
+from MTUOC_profiling import job_profiler
+from MTUOC_store import open_store
+from TextBox_translator import MTServerError
+from MTUOC_downloads import DownloadDirectory
+
+
+def session_id():
+    """Identifies the browser session, for the fair sharing of the MT servers between users."""
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else None
 
 
 st.set_page_config(page_title="MTUOC web translator", page_icon=None, layout="wide", initial_sidebar_state="auto", menu_items=None)
 
 #st.image("MTUOC-logo.png", width=180)
 
-text, files = st.tabs(["Text box", "Files"])
+text, files, admin = st.tabs(["Text box", "Files", "Admin"])
 
 
-with open("mtSystems.yaml") as stream:
-        try:
-            mtSystems = yaml.safe_load(stream)
-        except yaml.YAMLError as exc:
-            print(exc)
-            
-names=[]        
-IP={}
-port={}  
-source_suffix={}           
-target_suffix={}      
-server_type={}
-for system in mtSystems:
-    names.append(system["name"])
-    IP[system["name"]]=system["ip"]
-    port[system["name"]]=system["port"]
-    source_suffix[system["name"]]=system["source_suffix"]
-    target_suffix[system["name"]]=system["target_suffix"]
-    server_type[system["name"]]=system["server_type"]
+# The engines (with their translation memories) and the document cache are
+# created once per server process, not on every rerun of the script. With
+# MTUOC_STORE (see MTUOC_store.py), the translated segments and the document
+# cache are shared with the other processes behind the same proxy
+@st.cache_resource
+def get_engines():
+    return load_engines("mtSystems.yaml")
+
+@st.cache_resource
+def get_store():
+    return open_store(os.environ.get("MTUOC_STORE"))
+
+@st.cache_resource
+def get_document_cache():
+    return DocumentCache("document_cache", store=get_store())
+
+# The translated files are served from static/downloads (see MTUOC_downloads.py)
+@st.cache_resource
+def get_downloads():
+    script_dir = Path(__file__).parent.resolve()
+    return DownloadDirectory(os.path.join(script_dir, "static", "downloads"),
+                             max_age=float(os.environ.get("MTUOC_DOWNLOAD_HOURS") or 24)*3600)
+
+engines=get_engines()
+names=list(engines)
+store=get_store()
+document_cache=get_document_cache()
+downloads=get_downloads()
 
 
 with text:
     #st.header("Translate text")
     # Selection list for MT engine
     mt_engine = st.selectbox("Select MT Engine:", names, key="mt_engine_text_select")
-    ip = IP[mt_engine]
-    portMT = port[mt_engine]
-    server_type=server_type[mt_engine]
     # Text area for user input
     input_text = st.text_area("Enter text:", help="Enter the text you want to translate")
     # Placeholder for translation
@@ -178,59 +72,94 @@ with text:
     # Button to trigger translation
     if st.button("Translate"):
         # Call translation function
-        translation = translate_segment(input_text,server_type,ip,portMT)
+        try:
+            with scheduling(INTERACTIVE, session_id()):
+                translation = engines[mt_engine].translate(input_text)
+        except QueueFull as e:
+            st.warning(str(e))
+        except MTServerError as e:
+            st.error(str(e))
     # Display translation
     translation_text_area=st.text_area("Translation:", value=translation, help="The translation will be shown here")
 
 with files:
     mt_engine = st.selectbox("Select MT Engine:", names, key="mt_engine_files_select")
 
-    ip = IP[mt_engine]
-    portMT = port[mt_engine]
-    target_suffixMT = target_suffix[mt_engine]
-    
-    #####
-    traductor=Tikal()
-    traductor.set_path("./tikalMTUOC.sh")
-    traductor.set_sl(source_suffix[mt_engine])
-    traductor.set_tl(target_suffix[mt_engine])
-    traductor.set_srx_file("segment.srx")
-    traductor.set_ip(ip)
-    traductor.set_port(portMT)
-
-    os_name = platform.system()
-    if os_name=="Linux":
-        traductor.set_path("./tikalMTUOC.sh")
-    if os_name=="Windows":
-        traductor.set_path("tikalWin.bat")
-    
-    #####
-    
     script_dir = Path(__file__).parent.resolve()
 
     with tempfile.TemporaryDirectory(dir=script_dir) as temp_dir:
         uploaded_file = st.file_uploader(label="Upload a file", key="mt_engine_files_upload")
 
         if uploaded_file is not None:
-            totranslate = os.path.join(temp_dir, uploaded_file.name)
-            with open(totranslate, "wb") as f:
-                f.write(uploaded_file.getbuffer())
-
-            with st.spinner(text="In progress..."):
-                cwd = os.getcwd()
-                #os.chdir(temp_dir)  # CAMBIAMOS al temp_dir
-                traductor.translate(totranslate)  # solo el nombre del archivo
-                #os.chdir(cwd)  # VOLVEMOS
-
-            translated_file_path = totranslate.replace(".docx", ".out.docx")    
-            translated_file_name = os.path.basename(translated_file_path)
-            print(translated_file_path,translated_file_name)
-            if not os.path.exists(translated_file_path):
-                st.error(f"Translated file not found: {translated_file_path}")
-            else:
-                with open(translated_file_path, 'rb') as f:            
-                    st.download_button('Download translated version', f, translated_file_name)
-
-        
-
-
+            # the translation is kept in the session, so the reruns of the script
+            # (e.g. when another widget changes) do not translate the file again
+            download_key = (uploaded_file.file_id, mt_engine)
+            download = st.session_state.get("download")
+            if download is None or download[0] != download_key or not os.path.exists(download[1]):
+                download = None
+                totranslate = os.path.join(temp_dir, os.path.basename(uploaded_file.name))
+                # written in chunks: the cleaners and Tikal read the file from disk
+                save_upload(uploaded_file, totranslate)
+                # the translation is written directly where it is downloaded from
+                translated_file_path = downloads.new_path(output_name(totranslate))
+
+                queue_status = st.empty()
+                with st.spinner(text="In progress..."):
+                    try:
+                        with scheduling(user=session_id()):
+                            translate_file(totranslate, engines[mt_engine], outpath=translated_file_path, document_cache=document_cache,
+                                           on_queued=lambda position: queue_status.info(f"Queued, position {position}"),
+                                           store=store)
+                        download = (download_key, translated_file_path)
+                        st.session_state["download"] = download
+                    # RuntimeError: the translation could not be merged into a valid document,
+                    # OSError: Tikal failed or did not write the translated file
+                    except (MemoryBudgetExceeded, QueueFull, MTServerError, RuntimeError, OSError) as e:
+                        st.error(str(e))
+                    finally:
+                        if download is None:
+                            downloads.remove(translated_file_path)
+                    queue_status.empty()
+
+            if download is not None:
+                translated_file_path = download[1]
+                translated_file_name = os.path.basename(translated_file_path)
+                if st.get_option("server.enableStaticServing") and downloads.servable(translated_file_path):
+                    # streamed from disk by the static file route of Streamlit
+                    st.markdown(f'<a href="{downloads.url(translated_file_path)}" download="{html.escape(translated_file_name)}">'
+                                f'Download translated version</a>', unsafe_allow_html=True)
+                else:
+                    with open(translated_file_path, 'rb') as f:
+                        st.download_button('Download translated version', f, translated_file_name)
+
+with admin:
+    # the admin panel shows the documents of all users and can slow down their jobs
+    admin_password = os.environ.get("MTUOC_ADMIN_PASSWORD")
+    if not admin_password:
+        st.caption("Set the environment variable MTUOC_ADMIN_PASSWORD to use the admin panel.")
+    elif st.text_input("Admin password:", type="password", key="admin_password") == admin_password:
+        st.subheader("Pipeline stages")
+        st.table(metrics.stage_summary())
+        st.subheader("MT engines")
+        st.table(metrics.latency_summary())
+        st.subheader("MT server queues")
+        st.table(scheduler_summary())
+        st.subheader("Document queue")
+        st.table([document_queue.stats()])
+        st.subheader("Recent file jobs")
+        st.table(metrics.recent_jobs())
+        with st.expander("Prometheus metrics"):
+            st.code(metrics.prometheus())
+        st.subheader("Profiling")
+        # job_profiler is shared by all the sessions of the server: the toggle shows its
+        # current state, and only changes it when this admin clicks it
+        def set_profiling():
+            job_profiler.enabled = st.session_state["profile_jobs"]
+        st.session_state["profile_jobs"] = job_profiler.enabled
+        st.toggle("Profile the next file jobs (cProfile and tracemalloc)", key="profile_jobs", on_change=set_profiling)
+        profiled_jobs = job_profiler.profiled_jobs()
+        if profiled_jobs:
+            profiled_job = st.selectbox("Profiled job:", profiled_jobs)
+            for name, path in job_profiler.files(profiled_job).items():
+                with open(path, 'rb') as f:
+                    st.download_button(f"Download {name}", f, f"{profiled_job}-{name}", key=f"profile-{profiled_job}-{name}")
@@ -0,0 +1,109 @@
+import os
+import threading
+from contextlib import contextmanager
+
+"""
+    Admission control for the work that the translator accepts.
+
+    Translating a document starts a Tikal JVM and the cleaners, which take
+    a lot of CPU and memory, so only a few documents are processed at the
+    same time. The rest wait in a queue of bounded length, and are rejected
+    with QueueFull when the queue is full, instead of piling up until the
+    server thrashes. While a document waits, a callback receives its
+    position in the queue, so that the web interface can show it.
+
+    The limits of the module-level document_queue are 2 documents at the
+    same time and 10 waiting, unless the environment variables
+    MTUOC_DOCUMENT_WORKERS and MTUOC_DOCUMENT_QUEUE are set. The requests to
+    the MT servers are limited per server by the scheduler (see
+    MTUOC_scheduler), which also rejects interactive requests with QueueFull
+    beyond max_queued_requests.
+"""
+
+
+class QueueFull(Exception):
+    pass
+
+
+class AdmissionQueue():
+    def __init__(self, name, workers=2, max_queue=10):
+        self.name=name
+        self.workers=workers
+        self.max_queue=max_queue
+        self.active=0
+        self.waiting=[]
+        self.condition=threading.Condition()
+
+    def set_limits(self, workers=None, max_queue=None):
+        with self.condition:
+            if workers is not None:
+                self.workers=workers
+            if max_queue is not None:
+                self.max_queue=max_queue
+            self.condition.notify_all()
+
+    def full(self):
+        with self.condition:
+            return self.active>=self.workers and len(self.waiting)>=self.max_queue
+
+    def next_position(self, ticket, reported):
+        """Waits until ticket can start (returns 0) or its position in the queue is not reported (returns it)."""
+        with self.condition:
+            while True:
+                if self.active<self.workers and self.waiting[0] is ticket:
+                    self.waiting.pop(0)
+                    self.active+=1
+                    # the next one may also fit
+                    self.condition.notify_all()
+                    return 0
+                position=self.waiting.index(ticket)+1
+                if position!=reported:
+                    return position
+                self.condition.wait()
+
+    @contextmanager
+    def admit(self, on_wait=None):
+        """
+        Waits for a free worker, in order of arrival, calling on_wait(position)
+        whenever the position in the queue changes. Raises QueueFull if the
+        queue is full.
+        """
+        ticket=object()
+        with self.condition:
+            if self.active>=self.workers and len(self.waiting)>=self.max_queue:
+                raise QueueFull(f"Too many {self.name} waiting ({len(self.waiting)}), please try again later")
+            self.waiting.append(ticket)
+        try:
+            position=None
+            while True:
+                # the callback is called without holding the lock
+                position=self.next_position(ticket, position)
+                if not position:
+                    break
+                if on_wait is not None:
+                    on_wait(position)
+        except BaseException:
+            # the waiting thread was stopped, e.g. the Streamlit script was rerun
+            with self.condition:
+                if ticket in self.waiting:
+                    self.waiting.remove(ticket)
+                else:
+                    self.active-=1
+                self.condition.notify_all()
+            raise
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.active-=1
+                self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            return {"queue": self.name, "active": self.active, "waiting": len(self.waiting),
+                    "workers": self.workers, "max_queue": self.max_queue}
+
+
+document_queue=AdmissionQueue("documents",
+                              int(os.environ.get("MTUOC_DOCUMENT_WORKERS") or 2),
+                              int(os.environ.get("MTUOC_DOCUMENT_QUEUE") or 10))
@@ -0,0 +1,192 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import tracemalloc
+
+from MTUOC_engines import MTEngine
+from MTUOC_mock_server import MockMTServer
+from MTUOC_synthetic_documents import make_document
+
+"""
+    Benchmarks of the cleaners, the MT protocols and the file pipeline.
+
+    The benchmark generates synthetic DOCX, ODT and PPTX documents of
+    increasing size and fragmentation (runs per paragraph), and translates
+    against a local mock MT server, so the results are reproducible and do
+    not depend on a real engine. For every case it reports the time, the
+    throughput, the latency percentiles (for MT requests) and the peak of
+    Python memory allocations (measured with tracemalloc, which does not see
+    the memory allocated by lxml in C). The results can be saved as JSON and
+    compared between versions to catch performance regressions.
+
+    The full pipeline (cleaning, Tikal extraction and segmentation, MT,
+    merge, validation) is only measured with --pipeline, as it needs Tikal.
+"""
+
+PROTOCOLS=["MTUOC", "OpenNMT", "NMTWizard", "ModernMT"]
+
+
+def measure(function, *args):
+    """Runs function, returning its result, the elapsed seconds and the peak of allocated memory in MB."""
+    tracemalloc.start()
+    start=time.perf_counter()
+    try:
+        result=function(*args)
+    finally:
+        elapsed=time.perf_counter()-start
+        current, peak=tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return result, elapsed, peak/(1024*1024)
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered=sorted(values)
+    return ordered[min(len(ordered)-1, int(round(fraction*(len(ordered)-1))))]
+
+
+def cleaner_for(extension):
+    if extension==".docx":
+        from MTUOC_cleanDOCX import DocxCleaner
+        return DocxCleaner().clean_docx
+    elif extension==".odt":
+        from MTUOC_cleanODT import OdtCleaner
+        return OdtCleaner().clean_odt
+    else:
+        from MTUOC_cleanPPTX import PptxCleaner
+        return PptxCleaner().clean_pptx
+
+
+def bench_cleaners(workdir, formats, sizes, fragmentations):
+    results=[]
+    for extension in formats:
+        for paragraphs in sizes:
+            for runs in fragmentations:
+                case=f"{extension[1:]} {paragraphs}p x {runs}r"
+                path=os.path.join(workdir, f"bench_{paragraphs}_{runs}{extension}")
+                make_document(path, paragraphs, runs)
+                try:
+                    _, elapsed, peak=measure(cleaner_for(extension), path, path.replace(extension, ".clean"+extension))
+                except Exception as e:
+                    results.append({"stage": "cleaning", "case": case, "error": str(e)})
+                    continue
+                results.append({"stage": "cleaning", "case": case, "seconds": elapsed,
+                                "throughput": paragraphs/elapsed, "unit": "paragraphs/s", "peak_mb": peak})
+    return results
+
+
+def bench_protocols(port, segments, batch_size):
+    results=[]
+    texts=[f'Segment number {i} with <g id="1">some inline</g> markup.' for i in range(segments)]
+    for protocol in PROTOCOLS:
+        engine=MTEngine({"name": "mock-"+protocol, "ip": "127.0.0.1", "port": port, "server_type": protocol,
+                         "source_suffix": "en", "target_suffix": "es"})
+        latencies=[]
+
+        def one_by_one():
+            for text in texts:
+                start=time.perf_counter()
+                engine.translate(text)
+                latencies.append(time.perf_counter()-start)
+
+        _, elapsed, peak=measure(one_by_one)
+        results.append({"stage": "mt", "case": protocol+" single", "seconds": elapsed,
+                        "throughput": segments/elapsed, "unit": "segments/s", "peak_mb": peak,
+                        "p50_ms": percentile(latencies, 0.5)*1000, "p95_ms": percentile(latencies, 0.95)*1000,
+                        "p99_ms": percentile(latencies, 0.99)*1000})
+
+        latencies=[]
+
+        def batched():
+            for start in range(0, len(texts), batch_size):
+                begin=time.perf_counter()
+                engine.translate_batch(texts[start:start+batch_size])
+                latencies.append(time.perf_counter()-begin)
+
+        _, elapsed, peak=measure(batched)
+        results.append({"stage": "mt", "case": f"{protocol} batch {batch_size}", "seconds": elapsed,
+                        "throughput": segments/elapsed, "unit": "segments/s", "peak_mb": peak,
+                        "p50_ms": percentile(latencies, 0.5)*1000, "p95_ms": percentile(latencies, 0.95)*1000,
+                        "p99_ms": percentile(latencies, 0.99)*1000})
+    return results
+
+
+def bench_pipeline(workdir, port, formats, sizes, fragmentations):
+    from MTUOC_file_translator import translate_file
+    from MTUOC_metrics import metrics
+
+    results=[]
+    engine=MTEngine({"name": "mock-MTUOC", "ip": "127.0.0.1", "port": port, "server_type": "MTUOC",
+                     "source_suffix": "en", "target_suffix": "es"})
+    for extension in formats:
+        for paragraphs in sizes:
+            for runs in fragmentations:
+                case=f"{extension[1:]} {paragraphs}p x {runs}r"
+                path=os.path.join(workdir, f"pipeline_{paragraphs}_{runs}{extension}")
+                make_document(path, paragraphs, runs)
+                try:
+                    _, elapsed, peak=measure(translate_file, path, engine, None, os.path.join(workdir, "checkpoints"))
+                except Exception as e:
+                    results.append({"stage": "pipeline", "case": case, "error": str(e)})
+                    continue
+                job=metrics.recent_jobs()[0]
+                results.append({"stage": "pipeline", "case": case, "seconds": elapsed,
+                                "throughput": job["segments"]/elapsed, "unit": "segments/s", "peak_mb": peak})
+                for stage, seconds in job["stages"].items():
+                    results.append({"stage": "pipeline:"+stage, "case": case, "seconds": seconds})
+    return results
+
+
+def print_report(results):
+    print(f"{'stage':<22} {'case':<24} {'seconds':>9} {'throughput':>22} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'peak MB':>8}")
+    for result in results:
+        if "error" in result:
+            print(f"{result['stage']:<22} {result['case']:<24} ERROR: {result['error']}")
+            continue
+        throughput=f"{result['throughput']:.1f} {result['unit']}" if "throughput" in result else ""
+        percentiles="".join(f" {result[key]:>8.1f}" if key in result else " "*9 for key in ("p50_ms", "p95_ms", "p99_ms"))
+        peak=f"{result['peak_mb']:>8.1f}" if "peak_mb" in result else ""
+        print(f"{result['stage']:<22} {result['case']:<24} {result['seconds']:>9.3f} {throughput:>22}{percentiles} {peak}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the cleaners, the MT protocols and the file pipeline.")
+    parser.add_argument("--formats", default="docx,odt,pptx", help="Document formats for the cleaner benchmarks")
+    parser.add_argument("--sizes", default="10,100,1000", help="Number of paragraphs of the synthetic documents")
+    parser.add_argument("--fragmentation", default="1,5,20", help="Runs per paragraph of the synthetic documents")
+    parser.add_argument("--segments", type=int, default=200, help="Segments sent to the mock MT server per protocol")
+    parser.add_argument("--batch-size", type=int, default=32, help="Segments per batch in the batched MT benchmark")
+    parser.add_argument("--latency", type=float, default=0.005, help="Latency of the mock MT server, in seconds")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Latency of the mock MT server per token of the padded batch")
+    parser.add_argument("--pipeline", action="store_true", help="Also benchmark the full file pipeline (needs Tikal)")
+    parser.add_argument("--json", default=None, help="Save the results in this JSON file")
+    args = parser.parse_args()
+
+    formats=["."+extension.strip() for extension in args.formats.split(",")]
+    sizes=[int(size) for size in args.sizes.split(",")]
+    fragmentations=[int(runs) for runs in args.fragmentation.split(",")]
+
+    server=MockMTServer(latency=args.latency, token_latency=args.token_latency)
+    port=server.start_in_thread()
+    workdir=tempfile.mkdtemp(prefix="MTUOC-benchmark-")
+    try:
+        results=bench_cleaners(workdir, formats, sizes, fragmentations)
+        results.extend(bench_protocols(port, args.segments, args.batch_size))
+        if args.pipeline:
+            results.extend(bench_pipeline(workdir, port, formats, sizes, fragmentations))
+    finally:
+        server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
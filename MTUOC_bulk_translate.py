@@ -0,0 +1,209 @@
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from MTUOC_engines import load_engines
+from MTUOC_translation_cache import TranslationCache
+from MTUOC_package import memory_budget
+from MTUOC_document_cache import DocumentCache
+from MTUOC_scheduler import scheduling, BULK
+from MTUOC_store import open_store
+from MTUOC_admission import document_queue
+
+"""
+    Command-line bulk translator.
+
+    Translates with an engine from mtSystems.yaml either a text corpus (one
+    segment per line) or a directory tree of documents. Segments are sent in
+    batches by several parallel workers, translations are cached, and the
+    progress is saved in a checkpoint file, so that an interrupted run can be
+    restarted with the same command and continues where it stopped.
+"""
+
+DOCUMENT_EXTENSIONS=[".docx", ".odt", ".odf", ".pptx", ".xlsx", ".html", ".htm", ".xml", ".txt"]
+
+
+class ProgressReport():
+    def __init__(self, unit):
+        self.unit=unit
+        self.start=time.time()
+        self.done=0
+
+    def add(self, count, total=None):
+        self.done+=count
+        elapsed=max(time.time()-self.start, 1e-6)
+        total_str="" if total is None else "/"+str(total)
+        print(f"{self.done}{total_str} {self.unit} translated, {self.done/elapsed:.1f} {self.unit}/sec", file=sys.stderr)
+
+
+def read_checkpoint(checkpoint_path):
+    if not os.path.exists(checkpoint_path):
+        return {}
+    with open(checkpoint_path, encoding="utf-8") as f:
+        try:
+            return json.load(f)
+        except ValueError:
+            return {}
+
+
+def write_checkpoint(checkpoint_path, checkpoint):
+    # write and rename, so that a killed run never leaves a truncated checkpoint
+    with open(checkpoint_path+".tmp", "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+    os.replace(checkpoint_path+".tmp", checkpoint_path)
+
+
+def translate_corpus(engine, input_path, output_path, cache, workers=4, batch_size=32, checkpoint_path=None):
+    """Translates a corpus with one segment per line. Returns the number of segments translated."""
+    if checkpoint_path is None:
+        checkpoint_path=output_path+".checkpoint"
+    with open(input_path, encoding="utf-8") as f:
+        segments=[line.rstrip("\n") for line in f]
+
+    checkpoint=read_checkpoint(checkpoint_path)
+    done=checkpoint.get("lines", 0) if os.path.exists(output_path) else 0
+    if done:
+        print(f"Resuming {input_path} at line {done}", file=sys.stderr)
+        # drop any line written after the last checkpoint
+        with open(output_path, encoding="utf-8") as f:
+            written=list(itertools.islice(f, done))
+        done=len(written)
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.writelines(written)
+
+    def translate_batch(batch):
+        # empty lines are kept as they are, without sending them to the MT server
+        translations=[segment if not segment.strip() else None for segment in batch]
+        to_translate=[segment for segment in batch if segment.strip()]
+        if to_translate:
+            # the web interface and the API go first in the MT servers
+            with scheduling(BULK):
+                translated=iter(cache.translate_batch(engine, to_translate))
+            translations=[next(translated) if translation is None else translation for translation in translations]
+        return translations
+
+    progress=ProgressReport("segments")
+    chunk_size=batch_size*workers
+    with ThreadPoolExecutor(max_workers=workers) as executor, open(output_path, "a", encoding="utf-8") as output:
+        for start in range(done, len(segments), chunk_size):
+            chunk=segments[start:start+chunk_size]
+            batches=[chunk[i:i+batch_size] for i in range(0, len(chunk), batch_size)]
+            for translations in executor.map(translate_batch, batches):
+                for translation in translations:
+                    output.write(translation+"\n")
+            output.flush()
+            write_checkpoint(checkpoint_path, {"lines": start+len(chunk)})
+            progress.add(len(chunk), len(segments)-done)
+    return len(segments)-done
+
+
+def translate_directory(engine, input_dir, output_dir, cache, workers=4, batch_size=32, checkpoint_path=None, document_cache=None):
+    """
+    Translates all the documents in a directory tree, mirroring the tree in
+    output_dir. With a DocumentCache, documents already translated are not
+    translated again. A document that fails is reported and skipped, and
+    it is translated again in the next run. Returns the number of documents
+    translated and the list of documents that failed.
+    """
+    # imported here, so that translating corpora does not need the document libraries
+    from MTUOC_file_translator import translate_file
+
+    if checkpoint_path is None:
+        checkpoint_path=os.path.join(output_dir, ".checkpoint")
+    os.makedirs(output_dir, exist_ok=True)
+    checkpoint=read_checkpoint(checkpoint_path)
+    completed=set(checkpoint.get("files", []))
+
+    documents=[]
+    for root, dirs, files in os.walk(input_dir):
+        dirs.sort()
+        for name in sorted(files):
+            relative=os.path.relpath(os.path.join(root, name), input_dir)
+            if os.path.splitext(name)[1].lower() in DOCUMENT_EXTENSIONS and relative not in completed:
+                documents.append(relative)
+    if completed:
+        print(f"Resuming: {len(completed)} files already translated", file=sys.stderr)
+
+    def translate_document(relative):
+        input_path=os.path.join(input_dir, relative)
+        output_path=os.path.join(output_dir, relative)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        if os.path.splitext(relative)[1].lower()==".txt":
+            # plain text files are corpora, translated through the cache
+            translate_corpus(engine, input_path, output_path, cache, 1, batch_size, output_path+".checkpoint")
+            os.remove(output_path+".checkpoint")
+        else:
+            with scheduling(BULK):
+                translate_file(input_path, engine, output_path, batch_size=batch_size, document_cache=document_cache)
+        return relative
+
+    progress=ProgressReport("files")
+    failed=[]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures={executor.submit(translate_document, relative): relative for relative in documents}
+        for future in as_completed(futures):
+            relative=futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Error translating {relative}: {e}", file=sys.stderr)
+                failed.append(relative)
+                continue
+            completed.add(relative)
+            write_checkpoint(checkpoint_path, {"files": sorted(completed)})
+            progress.add(1, len(documents))
+    return len(documents)-len(failed), sorted(failed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Translate a corpus or a directory of documents with an engine from mtSystems.yaml.")
+    parser.add_argument("engine", help="Name of the engine in mtSystems.yaml")
+    parser.add_argument("input", help="Corpus file (one segment per line) or directory of documents")
+    parser.add_argument("output", help="Output corpus file or directory")
+    parser.add_argument("--config", default="mtSystems.yaml", help="MT systems configuration file")
+    parser.add_argument("--workers", type=int, default=4, help="Number of parallel workers")
+    parser.add_argument("--batch-size", type=int, default=32, help="Segments per request to the MT server")
+    parser.add_argument("--cache", default="translation_cache.jsonl", help="Translation cache file (use '' to disable persistence)")
+    parser.add_argument("--checkpoint", default=None, help="Checkpoint file (default: next to the output)")
+    parser.add_argument("--document-cache", default="document_cache", help="Directory of translated documents (use '' to disable)")
+    parser.add_argument("--memory-budget", type=int, default=None, help="MB of memory shared by the documents translated at the same time")
+    parser.add_argument("--store", default=os.environ.get("MTUOC_STORE"), help="Shared store for the translation and document caches, e.g. sqlite:///path/store.db (see MTUOC_store.py)")
+    args = parser.parse_args()
+
+    if args.memory_budget is not None:
+        memory_budget.set_total(args.memory_budget)
+    # the workers translate one document each, and none of them may be rejected as in the web interface
+    document_queue.set_limits(workers=args.workers, max_queue=args.workers)
+
+    engines=load_engines(args.config)
+    if args.engine not in engines:
+        print(f"Unknown engine {args.engine}. Available engines: {', '.join(engines)}", file=sys.stderr)
+        sys.exit(1)
+    engine=engines[args.engine]
+    store=open_store(args.store)
+    # with a shared store, the cache is shared with the web interface and the API
+    cache=TranslationCache(args.cache or None) if store is None else TranslationCache(store=store)
+
+    start=time.time()
+    failed=[]
+    if os.path.isdir(args.input):
+        document_cache=DocumentCache(args.document_cache, store=store) if args.document_cache else None
+        count, failed=translate_directory(engine, args.input, args.output, cache, args.workers, args.batch_size, args.checkpoint, document_cache)
+        unit="files"
+    else:
+        count=translate_corpus(engine, args.input, args.output, cache, args.workers, args.batch_size, args.checkpoint)
+        unit="segments"
+    elapsed=max(time.time()-start, 1e-6)
+    cache.close()
+    print(f"Translated {count} {unit} in {elapsed:.1f} s ({count/elapsed:.1f} {unit}/sec), cache hits: {cache.hits}, misses: {cache.misses}")
+    if failed:
+        print(f"{len(failed)} files failed, run the same command again to retry them: {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -62,208 +62,170 @@ class OdtCleaner():
             "fo:background-color",
             "style:text-position",
             "style:text-line-through-style"]
-
+        self.reset_caches()
+
+    def reset_caches(self):
+        """The caches depend on the styles of the document, so they are reset for every document."""
+        # visible properties set by each text style, read once per style name
+        self.style_cache = {}
+        # text styles without properties, which the strip pass leaves alone
+        self.styles_without_properties = set()
+        # (style name, inherited, initial) -> (new inherited, fingerprint)
+        self.properties_cache = {}
+        # Visible properties are kept as tuples in the order of self.visible_props,
+        # interned so that equal properties are always the same object and can be
+        # compared with "is" instead of property by property.
+        self.fingerprints = {}
+
+    def intern(self, properties):
+        properties = tuple(properties)
+        return self.fingerprints.setdefault(properties, properties)
+
+    def style_properties(self, span):
+        """Returns the visible properties set by the text style of span as a dict, or None if span is not a styled text span."""
+        try:
+            style_name = span.style
+        except AttributeError:
+            return None
+        if style_name not in self.style_cache:
+            try:
+                properties = self.document.get_style("text",style_name).get_properties()
+                # text styles are returned as none if they have no properties, change them to empty dict
+                # so that they are processed correctly
+                if properties is None:
+                    properties = dict()
+                    self.styles_without_properties.add(style_name)
+                self.style_cache[style_name] = {visible_prop: properties[visible_prop] for visible_prop in self.visible_props if visible_prop in properties}
+            except:
+                self.style_cache[style_name] = None
+        return self.style_cache[style_name]
+
+    def visible_properties(self, span, inherited_visible_properties):
+        """
+        Returns the visible properties inherited by the children of span and
+        the fingerprint of span, which has the properties missing in its style
+        filled from the paragraph. Both are interned tuples. Returns None if
+        span is not a styled text span.
+        """
+        style_properties = self.style_properties(span)
+        if style_properties is None:
+            return None
+        key = (span.style, inherited_visible_properties, self.initial_visible_properties)
+        if key not in self.properties_cache:
+            new_inherited_visible_properties = []
+            fingerprint = []
+            for visible_prop, inherited_value, initial_value in zip(self.visible_props, inherited_visible_properties, self.initial_visible_properties):
+                value = style_properties.get(visible_prop)
+                # ODT documents contain indexed variants of fonts, which appear to be functionally
+                # identical. I'm not sure how/why these are created, but for the purposes of comparing
+                # visible properties, we treat them as identical. This might backfire, if there actually
+                # are two really distinct fonts that differ only in trailing number, but it's very unlikely.
+                if visible_prop == "style:font-name" and value is not None and value.rstrip('1234567890') == inherited_value.rstrip('1234567890'):
+                    value = inherited_value
+                new_inherited_visible_properties.append(inherited_value if value is None else value)
+                fingerprint.append(initial_value if value is None else value)
+            self.properties_cache[key] = (self.intern(new_inherited_visible_properties), self.intern(fingerprint))
+        return self.properties_cache[key]
+
+    # The passes below read the children of a parent once (odfdo builds a new list
+    # on every access of children) and walk that list, instead of indexing the
+    # current children with an offset that follows the insertions and deletions.
 
     # This applies to spans with children but with no text in them. 
     def join_visually_identical_adjacent_spans_with_children(self, inherited_visible_properties, parent : Element, level):
         previous_span = None
-        previous_style = None
-        offset = 0
-        for span_index in range(0,len(parent.children)):
-            
-            span = parent.children[span_index-offset]
-            
+        previous_fingerprint = None
+        for span in parent.children:
             # skip tags with text, as it complicates things too much (TODO?)
             if span.text or not span.children:
                 previous_span = None
-                previous_style = None
                 continue
 
-            new_inherited_visible_properties = dict(inherited_visible_properties)
-
             # if this is not a text span, we still need to process its children, e.g.
             # footnote tags have embedded text tags
-            try:
-                span_style_properties = self.document.get_style("text",span.style).get_properties()
-                # text styles are returned as none if they have no properties, change them to empty dict
-                # so that they are processed correctly
-                if span_style_properties is None:
-                    span_style_properties = dict()
-            except:
-                span_style_properties = None
-            
-
-            # fill out the missing visible properties in the span
-            if span_style_properties is not None and "style:font-name" in span_style_properties:
-                if span_style_properties["style:font-name"].rstrip('1234567890') == inherited_visible_properties["style:font-name"].rstrip('1234567890'):
-                    span_style_properties["style:font-name"] = inherited_visible_properties["style:font-name"]
-
-            for visible_prop in self.visible_props:
-                if span_style_properties is not None:
-                    if visible_prop in span_style_properties:
-                        if (span_style_properties[visible_prop] != inherited_visible_properties[visible_prop]):
-                            new_inherited_visible_properties[visible_prop] = span_style_properties[visible_prop]
-                    else:
-                        span_style_properties[visible_prop] = self.initial_visible_properties[visible_prop]
+            properties = self.visible_properties(span, inherited_visible_properties)
+            if properties is None:
+                new_inherited_visible_properties, fingerprint = inherited_visible_properties, None
+            else:
+                new_inherited_visible_properties, fingerprint = properties
 
             #recursively process child elements
-            if span.children:
-                # is offset necessary here? the amount of children won't change when replacing
-                children_before = len(parent.children)
-                parent.replace_element(span,self.join_visually_identical_adjacent_spans_with_children(new_inherited_visible_properties,span,level+1))
-                children_now = len(parent.children)
-                offset += children_before-children_now
-
-            if previous_span:
-                visually_identical = True
-                for visible_prop in self.visible_props:
-                    if span_style_properties[visible_prop] != previous_style[visible_prop]:
-                        visually_identical = False
-                        break
-
-                if visually_identical:            
-                    # join this span to the previous span
-                    # this seems unnecessary, since previous_span is already specified?
-                    previous_span = parent.children[span_index-1-offset]
-                    for child in span.children:
-                        previous_span.append(child)
-                    previous_style = span_style_properties
-
-                    # can't join next spans if there is a tail, as there is intervening text
-                    # between spans
-                    if span.tail:
-                        previous_span.tail = span.tail
-                        span.tail = ""
-                        previous_span = None
-                        previous_style = None
-
-                    parent.delete(span)
-                    offset += 1
-                else:
-                    if not span.tail:
-                        previous_span = span
-                        previous_style = span_style_properties
-                    else:
-                        previous_span = None
-                        previous_style = None
+            self.join_visually_identical_adjacent_spans_with_children(new_inherited_visible_properties,span,level+1)
+
+            if previous_span is not None and fingerprint is not None and fingerprint is previous_fingerprint:
+                # join this span to the previous span
+                for child in span.children:
+                    previous_span.append(child)
+                # can't join next spans if there is a tail, as there is intervening text
+                # between spans. The tail is moved to the previous span when deleting.
+                if span.tail:
+                    previous_span = None
+                parent.delete(span)
             elif not span.tail:
                 previous_span = span
-                previous_style = span_style_properties
+                previous_fingerprint = fingerprint
             else:
                 previous_span = None
-                previous_style = None
         return parent 
 
     # This applies to spans with text but no children. 
     def join_visually_identical_adjacent_spans(self, inherited_visible_properties, parent : Element):
-        previous_style = None
-        offset = 0
-        for span_index in range(0,len(parent.children)):
-            span = parent.children[span_index-offset]
+        previous_span = None
+        previous_fingerprint = None
+        for span in parent.children:
             # if this is not a text span, we can skip it (can non-text spans have text children?)
-            try:
-                span_style_properties = self.document.get_style("text",span.style).get_properties()
-            except:
-                previous_style = None
+            properties = self.visible_properties(span, inherited_visible_properties)
+            if properties is None:
+                previous_span = None
                 continue
-            new_inherited_visible_properties = dict(inherited_visible_properties)
-
-            # fill out the missing visible properties in the span
-            if span_style_properties is not None and "style:font-name" in span_style_properties:
-                if span_style_properties["style:font-name"].rstrip('1234567890') == inherited_visible_properties["style:font-name"].rstrip('1234567890'):
-                    span_style_properties["style:font-name"] = inherited_visible_properties["style:font-name"]
+            new_inherited_visible_properties, fingerprint = properties
 
-            for visible_prop in self.visible_props:
-                if span_style_properties is not None:
-                    if visible_prop in span_style_properties:
-                        if (span_style_properties[visible_prop] != inherited_visible_properties[visible_prop]):
-                            new_inherited_visible_properties[visible_prop] = span_style_properties[visible_prop]
-                    else:
-                        span_style_properties[visible_prop] = self.initial_visible_properties[visible_prop]
-
-            # Run the joining recursively for children
+            # Run the joining recursively for children. Don't try to merge spans with children,
+            # as the text merging becomes too complex
             if span.children:
-                parent.replace_element(span,self.join_visually_identical_adjacent_spans(new_inherited_visible_properties, span))
-            
+                self.join_visually_identical_adjacent_spans(new_inherited_visible_properties, span)
+                previous_span = None
+                continue
+
             # Check if span visually identical to previous span
-            # don't try to join elements with children, too many unclear implications there
-            if previous_style and not span.children:
-                visually_identical = True
-                for visible_prop in self.visible_props:
-                    if span_style_properties[visible_prop] != previous_style[visible_prop]:
-                        visually_identical = False
-                        if not span.tail:
-                            previous_style = span_style_properties
-                        break
-                if visually_identical:            
-                    # join this span to the previous span
-                    previous_span = parent.children[span_index-1-offset]
-                    previous_span.text = previous_span.text + span.text
-                    if span.tail:
-                        previous_span.tail = span.tail
-                        span.tail = ""
-                        previous_style = None
-                    parent.delete(span)
-                    offset += 1                
+            if previous_span is not None and fingerprint is previous_fingerprint:
+                # join this span to the previous span
+                previous_span.text = (previous_span.text or "") + (span.text or "")
+                if span.tail:
+                    previous_span = None
+                parent.delete(span)
+            # If the span has a tail, do not try to merge it, as the next tag is not adjacent.
+            elif not span.tail:
+                previous_span = span
+                previous_fingerprint = fingerprint
             else:
-                # If the span has a tail, do not try to merge it, as the next tag is not adjacent.
-                # Don't try to merge spans with children, as the text merging becomes too complex
-                if span.tail or span.children:
-                    previous_style = None
-                else:
-                    previous_style = span_style_properties
+                previous_span = None
 
         return parent
 
 
     # First remove all spans that are visually identical to their parent. Do this recursively, as text spans may be nested
     def strip_visually_identical_child_spans(self, inherited_visible_properties,parent,level):
-
-        # The amount of children may decrease or increase during the loop, so keep an offset
-        offset = 0
-        for span_index in range(0,len(parent.children)):
-            #print("\t"*level + f"spans: {len(parent.children)}, span index: {span_index}, offset: {offset}")
-            span = parent.children[span_index-offset]
-            #print("\t"*level + str(span))
-            new_inherited_visible_properties = dict(inherited_visible_properties)
-            visually_identical = True
-
+        # The spans are stripped all at once at the end, as stripping rebuilds the parent
+        identical_spans = []
+        for span in parent.children:
             # if this is not a text span, we still need to process its children, e.g.
             # footnote tags have embedded text tags
-            try:
-                span_style_properties = self.document.get_style("text",span.style).get_properties()
-            except:
-                span_style_properties = None
-            
-            # ODT documents contain indexed variants of fonts, which appear to be functionally
-            # identical. I'm not sure how/why these are created, but for the purposes of comparing
-            # visible properties, we treat them as identical. This might backfire, if there actually 
-            # are two really distinct fonts that differ only in trailing number, but it's very unlikely.
-            if span_style_properties is not None and "style:font-name" in span_style_properties:
-                if span_style_properties["style:font-name"].rstrip('1234567890') == inherited_visible_properties["style:font-name"].rstrip('1234567890'):
-                    span_style_properties["style:font-name"] = inherited_visible_properties["style:font-name"]
-
-            for visible_prop in self.visible_props:
-                if span_style_properties is not None and visible_prop in span_style_properties:
-                    if (span_style_properties[visible_prop] != inherited_visible_properties[visible_prop]):
-                        new_inherited_visible_properties[visible_prop] = span_style_properties[visible_prop]
-                        visually_identical = False
+            properties = self.visible_properties(span, inherited_visible_properties)
+            if properties is None:
+                new_inherited_visible_properties = inherited_visible_properties
+            else:
+                new_inherited_visible_properties = properties[0]
 
             #recursively process child elements
-            if span.children:
-                # is this necessary here? the amount of children won't change when replacing
-                children_before = len(parent.children)
-                parent.replace_element(span,self.strip_visually_identical_child_spans(new_inherited_visible_properties,span,level+1))
-                children_now = len(parent.children)
-                offset += children_before-children_now
-                
-            if span_style_properties is not None and visually_identical:
-                children_before = len(parent.children)
-                #print("\t"*level + "Visually identical")
-                parent = parent.strip_elements(span)
-                children_now = len(parent.children)
-                offset += children_before-children_now
+            self.strip_visually_identical_child_spans(new_inherited_visible_properties,span,level+1)
+
+            # the span changes no visible property of its parent
+            if properties is not None and new_inherited_visible_properties is inherited_visible_properties and span.style not in self.styles_without_properties:
+                identical_spans.append(span)
 
+        if identical_spans:
+            parent = parent.strip_elements(identical_spans)
         return parent
 
 
@@ -299,6 +261,7 @@ class OdtCleaner():
 
     def clean_odt(self, odt_file_name, cleaned_file_name, debug=False):
         self.document = odfdo.Document(odt_file_name)
+        self.reset_caches()
         # if debugging, save the original file as xml for comparison
         if debug:
             self.document.save("original_" + odt_file_name, packaging="xml", pretty=True)
@@ -350,6 +313,7 @@ class OdtCleaner():
             for visible_prop in self.visible_props:
                 if visible_prop not in self.initial_visible_properties:
                     self.initial_visible_properties[visible_prop] = "none"
+            self.initial_visible_properties = self.intern(self.initial_visible_properties[visible_prop] for visible_prop in self.visible_props)
             
             new_para = self.strip_visually_identical_child_spans(self.initial_visible_properties,para,0)
 
@@ -0,0 +1,136 @@
+import argparse
+import re
+import shutil
+import zipfile
+from lxml import etree
+
+A_NS="http://schemas.openxmlformats.org/drawingml/2006/main"
+A_P="{%s}p" % A_NS
+A_R="{%s}r" % A_NS
+A_RPR="{%s}rPr" % A_NS
+A_T="{%s}t" % A_NS
+
+
+class PptxCleaner():
+    """
+    A class for merging visually identical runs in PPTX documents.
+
+    Motivation: as DOCX and ODT documents, presentations accumulate runs that
+    do not affect the appearance of the text: every edit, spell check or
+    language change splits a sentence in runs that only differ in attributes
+    such as lang, dirty or err. For localization these runs are tag soup:
+    Tikal extracts every run boundary as an inline code, which slows down
+    segmentation and makes the placement of codes in the translation almost
+    impossible.
+
+    Description of functionality: the cleaner works directly on the XML parts
+    of the package, without loading the presentation with python-pptx. For
+    every a:p paragraph in the slides, the notes and the SmartArt data (which
+    covers text boxes, placeholders, tables and grouped shapes alike),
+    adjacent a:r runs are merged when their a:rPr elements have the same
+    fingerprint: the run properties with the visually irrelevant attributes
+    removed. Fingerprints are interned, so comparing two runs is a single
+    identity check. Runs that only contain whitespace are joined to the
+    previous run, as in DocxCleaner. All the other parts of the package,
+    including media, are copied unchanged from zip to zip.
+    """
+
+    # attributes of a:rPr that do not change the appearance of the text
+    irrelevant_attributes=["lang", "altLang", "dirty", "err", "noProof", "smtClean", "smtId", "bmk"]
+
+    # parts of the package that contain the text to translate
+    text_parts=re.compile(r"^ppt/(slides/slide|notesSlides/notesSlide|diagrams/data)\d+\.xml$")
+
+    def __init__(self):
+        self.fingerprints={}
+
+    def fingerprint(self, run):
+        """Returns the interned fingerprint of the visible run properties of run."""
+        rpr=run.find(A_RPR)
+        if rpr is None:
+            key=()
+        else:
+            attributes=tuple(sorted((name, value) for name, value in rpr.attrib.items()
+                                    if name not in self.irrelevant_attributes))
+            children=tuple(etree.tostring(child) for child in rpr)
+            key=(attributes, children)
+        return self.fingerprints.setdefault(key, key)
+
+    def merge_runs(self, paragraph):
+        """Merges adjacent runs with identical visible properties. Returns the number of runs removed."""
+        removed=0
+        previous=None
+        previous_fingerprint=None
+        for child in list(paragraph):
+            if child.tag!=A_R:
+                # line breaks, fields etc. are not adjacent text
+                previous=None
+                continue
+            text_element=child.find(A_T)
+            text=text_element.text or "" if text_element is not None else ""
+            fingerprint=self.fingerprint(child)
+            if previous is not None and (fingerprint is previous_fingerprint or (text.isspace() and not child.tail)):
+                previous_text=previous.find(A_T)
+                if previous_text is None:
+                    previous_text=etree.SubElement(previous, A_T)
+                previous_text.text=(previous_text.text or "")+text
+                paragraph.remove(child)
+                removed+=1
+            else:
+                previous=child
+                previous_fingerprint=fingerprint
+        return removed
+
+    def clean_part(self, data):
+        """Cleans the paragraphs of an XML part. Returns the new content of the part."""
+        root=etree.fromstring(data)
+        for paragraph in root.iter(A_P):
+            self.merge_runs(paragraph)
+        return etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone=True)
+
+    def clean_pptx(self, input_path, output_path):
+        """Processes all the text parts of a presentation."""
+        with zipfile.ZipFile(input_path, "r") as zin, zipfile.ZipFile(output_path, "w") as zout:
+            for item in zin.infolist():
+                if self.text_parts.match(item.filename):
+                    zout.writestr(item, self.clean_part(zin.read(item)))
+                else:
+                    # copy the other parts (media included) without keeping them in memory
+                    with zin.open(item) as source, zout.open(item, "w") as target:
+                        shutil.copyfileobj(source, target, 1024*1024)
+
+    # This is used to validate that the conversion did not add or delete text
+    @staticmethod
+    def compare_pptx_files(file1, file2):
+        """Compares the text content of two PPTX files."""
+        def extract_text(path):
+            text=[]
+            with zipfile.ZipFile(path, "r") as package:
+                for name in package.namelist():
+                    if PptxCleaner.text_parts.match(name):
+                        root=etree.fromstring(package.read(name))
+                        text.extend(t.text or "" for t in root.iter(A_T))
+            return re.sub(r"\s+", "", "".join(text))
+
+        return extract_text(file1)==extract_text(file2)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Merge adjacent runs with identical formatting in PPTX files."
+    )
+    parser.add_argument("input", help="Input PPTX file path")
+    parser.add_argument("output", help="Output PPTX file path")
+    args = parser.parse_args()
+
+    pptx_cleaner = PptxCleaner()
+    pptx_cleaner.clean_pptx(args.input, args.output)
+    print(f"Cleaned presentation saved to: {args.output}")
+
+    if PptxCleaner.compare_pptx_files(args.input, args.output):
+        print("After tag cleaning, the presentations have same content without whitespaces")
+    else:
+        print("After tag cleaning, presentations are different in addition to whitespace differences")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import os
+import time
+import shutil
+import hashlib
+import threading
+
+from MTUOC_store import SQLiteStore
+
+
+class DocumentCache():
+    """
+    A cache of translated documents.
+
+    Documents are identified by the hash of their content and the engine and
+    language pair (see job_key in MTUOC_file_translator), so translating the
+    same file again returns the previous output without cleaning, Tikal or
+    MT. For every document the cache also keeps the segment translations
+    used to produce it. When a new version of a document (a file with the
+    same name, translated with the same engine) is uploaded, the segments
+    of the last version are reused, and only the new or changed segments
+    are sent to the MT engine.
+
+    The translated files (<key><extension>) are kept in a directory, and the
+    index is kept in a store (see MTUOC_store): for every document its
+    extension, last use and segments, and for every file name and engine,
+    the key of its last version. By default the store is an SQLite database
+    in the directory, so all the processes that use the same directory share
+    the cache. When there are more than max_documents, the least recently
+    used are removed.
+    """
+
+    def __init__(self, directory="document_cache", max_documents=1000, store=None):
+        self.directory=directory
+        self.max_documents=max_documents
+        self.lock=threading.Lock()
+        self.hits=0
+        self.misses=0
+        os.makedirs(self.directory, exist_ok=True)
+        self.store=store if store is not None else SQLiteStore(os.path.join(self.directory, "index.sqlite"))
+
+    def version_key(self, filename, engine):
+        """Identifies the versions of a document by its file name, the engine and the language pair."""
+        return hashlib.sha256(("\n".join([os.path.basename(filename), engine.name, engine.source_suffix, engine.target_suffix])).encode("utf-8")).hexdigest()
+
+    def get(self, key, extension):
+        """Returns the path of the cached translation of a document, or None."""
+        path=os.path.join(self.directory, key+extension)
+        document=self.store.get("document_cache:documents", key)
+        with self.lock:
+            if document is None or not os.path.exists(path):
+                self.misses+=1
+                return None
+            self.hits+=1
+        # the last use orders the documents for the eviction
+        self.store.put("document_cache:documents", key, dict(document, used=time.time()))
+        return path
+
+    def previous_segments(self, filename, engine):
+        """Returns the segment translations (source -> target) of the last version of a document."""
+        key=self.store.get("document_cache:versions", self.version_key(filename, engine))
+        if key is None:
+            return {}
+        return self.store.get("document_cache:segments", key) or {}
+
+    def put(self, key, filename, engine, output_path, segments):
+        """Stores a translated document and the segment translations (source -> target) used for it."""
+        extension=os.path.splitext(output_path)[1]
+        # written to a temporary file first, so that a document is never found half written
+        path=os.path.join(self.directory, key+extension)
+        shutil.copy(output_path, path+".tmp")
+        os.replace(path+".tmp", path)
+        self.store.put("document_cache:segments", key, segments)
+        self.store.put("document_cache:documents", key, {"extension": extension, "used": time.time()})
+        self.store.put("document_cache:versions", self.version_key(filename, engine), key)
+        with self.lock:
+            self.evict()
+
+    def evict(self):
+        if self.store.count("document_cache:documents")<=self.max_documents:
+            return
+        documents=sorted(self.store.items("document_cache:documents"), key=lambda item: item[1]["used"])
+        for key, document in documents[:len(documents)-self.max_documents]:
+            self.store.delete("document_cache:documents", key)
+            self.store.delete("document_cache:segments", key)
+            path=os.path.join(self.directory, key+document["extension"])
+            if os.path.exists(path):
+                os.remove(path)
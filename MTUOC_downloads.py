@@ -0,0 +1,68 @@
+import os
+import time
+import shutil
+import secrets
+from urllib.parse import quote
+
+"""
+    Translated files served to the browser as static files.
+
+    Instead of reading every translated file into the memory of the web
+    interface (st.download_button keeps a copy per session and rerun), the
+    pipeline writes the output directly into a directory with a random name
+    under static/downloads/, next to the Streamlit script, and the browser
+    downloads it from the static file route of Streamlit (app/static/...),
+    which streams it from disk. This requires enableStaticServing in
+    .streamlit/config.toml. Streamlit answers 404 for files larger than
+    MAX_STATIC_SIZE, so the web interface offers those with a download
+    button instead (see servable). The random names (tokens) cannot be
+    guessed, so a user can only download the files that were translated for
+    them.
+
+    The download directories older than max_age seconds are removed when a
+    new one is created: 24 hours, unless the environment variable
+    MTUOC_DOWNLOAD_HOURS is set.
+"""
+
+# Size limit of the static file route of Streamlit (MAX_APP_STATIC_FILE_SIZE)
+MAX_STATIC_SIZE=200*1024*1024
+
+
+class DownloadDirectory():
+    def __init__(self, directory, url_prefix="app/static/downloads", max_age=24*3600):
+        self.directory=directory
+        self.url_prefix=url_prefix
+        self.max_age=max_age
+
+    def new_path(self, filename):
+        """Returns the path where the file filename can be written to be downloaded, in a new directory."""
+        self.cleanup()
+        token_dir=os.path.join(self.directory, secrets.token_urlsafe(16))
+        os.makedirs(token_dir)
+        return os.path.join(token_dir, os.path.basename(filename))
+
+    def url(self, path):
+        """Relative URL of a file returned by new_path."""
+        token=os.path.basename(os.path.dirname(path))
+        return f"{self.url_prefix}/{token}/{quote(os.path.basename(path))}"
+
+    def servable(self, path):
+        """True if a file returned by new_path can be downloaded from the static file route."""
+        return os.path.getsize(path)<=MAX_STATIC_SIZE
+
+    def remove(self, path):
+        """Removes a file returned by new_path, e.g. if the translation failed."""
+        shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+    def cleanup(self):
+        if not os.path.isdir(self.directory):
+            return
+        oldest=time.time()-self.max_age
+        for token in os.listdir(self.directory):
+            token_dir=os.path.join(self.directory, token)
+            try:
+                if os.path.getmtime(token_dir)<oldest:
+                    shutil.rmtree(token_dir, ignore_errors=True)
+            except OSError:
+                # removed by another session at the same time
+                pass
@@ -0,0 +1,209 @@
+import time
+import yaml
+from concurrent.futures import ThreadPoolExecutor
+
+from TextBox_translator import translate_segment, translate_segments
+from MTUOC_metrics import metrics
+from MTUOC_translation_memory import TranslationMemory
+from MTUOC_translation_cache import TranslationCache
+from MTUOC_scheduler import get_scheduler, scheduling, current_priority, current_user
+
+# Protocols that translate several segments per request
+BATCH_SERVER_TYPES=["OpenNMT", "NMTWizard", "Moses"]
+
+
+def load_mt_systems(path="mtSystems.yaml"):
+    """Reads the list of MT systems from the YAML configuration file."""
+    mtSystems=[]
+    with open(path) as stream:
+        try:
+            mtSystems = yaml.safe_load(stream)
+        except yaml.YAMLError as exc:
+            print(exc)
+    if mtSystems is None:
+        mtSystems=[]
+    return mtSystems
+
+
+def token_length(segment):
+    """Approximate length of a segment in tokens, as seen by the MT server."""
+    return len(segment.split())
+
+
+def length_batches(segments, max_segments=None, max_tokens=None):
+    """
+    Groups the segments in batches of similar length. Returns a list of
+    batches, each a list of indexes of segments. The segments are sorted by
+    length, so that the batches need little padding, and a batch never has
+    more than max_segments segments or costs more than max_tokens tokens
+    once padded to its longest segment (a longer segment goes alone).
+    """
+    order=sorted(range(len(segments)), key=lambda i: token_length(segments[i]))
+    batches=[]
+    batch=[]
+    longest=0
+    for i in order:
+        length=max(longest, token_length(segments[i]))
+        if batch and ((max_segments is not None and len(batch)>=max_segments) or
+                      (max_tokens is not None and (len(batch)+1)*length>max_tokens)):
+            batches.append(batch)
+            batch=[]
+            length=token_length(segments[i])
+        batch.append(i)
+        longest=length
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class MTEngine():
+    """
+    An MT engine as configured in mtSystems.yaml.
+
+    The engine hides the protocol of the server (MTUOC, OpenNMT, NMTWizard,
+    ModernMT or Moses) so that the web interface, the API and the file
+    pipeline can translate with any configured engine in the same way.
+
+    With max_batch_tokens in the configuration, batches are sent to the
+    server sorted by length and split so that no request exceeds that number
+    of tokens once padded to its longest segment.
+
+    If the configuration has a translation_memory (a JSON lines file), the
+    segments are first looked up in a fuzzy-match TranslationMemory, and
+    only those without a match of at least fuzzy_threshold (0.95 by
+    default) are sent to the MT server.
+
+    Every request to the server waits for a slot of the scheduler shared by
+    all the engines of the server (see MTUOC_scheduler), which sends at most
+    max_concurrent_requests (4 by default) at the same time, and rejects
+    interactive requests when max_queued_requests are already waiting.
+    """
+
+    def __init__(self, config):
+        self.name=config["name"]
+        self.ip=config["ip"]
+        self.port=config["port"]
+        self.server_type=config["server_type"]
+        self.source_suffix=config["source_suffix"]
+        self.target_suffix=config["target_suffix"]
+        self.config=config
+        self.max_batch_tokens=config.get("max_batch_tokens")
+        self.scheduler=get_scheduler(self.ip, self.port, config.get("max_concurrent_requests", 4), config.get("max_queued_requests"))
+        self.memory=None
+        if config.get("translation_memory"):
+            self.memory=TranslationMemory(config["translation_memory"], config.get("fuzzy_threshold", 0.95))
+
+    def lookup(self, segment):
+        translation=self.memory.lookup(self.name, segment) if self.memory is not None else None
+        if translation is not None:
+            metrics.count("tm_hits_total")
+        return translation
+
+    def translate(self, segment):
+        translation=self.lookup(segment)
+        if translation is not None:
+            return translation
+        with self.scheduler.slot():
+            start=time.perf_counter()
+            translation=translate_segment(segment,self.server_type,self.ip,self.port)
+            metrics.observe_mt_latency(self.name, time.perf_counter()-start)
+        if self.memory is not None:
+            self.memory.add(self.name, segment, translation)
+        return translation
+
+    def translate_batch(self, segments):
+        translations=[self.lookup(segment) for segment in segments]
+        missing=[i for i, translation in enumerate(translations) if translation is None]
+        if not missing:
+            return translations
+        if self.server_type not in BATCH_SERVER_TYPES:
+            # one request per segment, so that other requests can go in between
+            batches=[[i] for i in missing]
+        elif self.max_batch_tokens is None:
+            batches=[missing]
+        else:
+            batches=[[missing[j] for j in batch] for batch in length_batches([segments[i] for i in missing], None, self.max_batch_tokens)]
+        for batch in batches:
+            with self.scheduler.slot():
+                start=time.perf_counter()
+                translated=translate_segments([segments[i] for i in batch],self.server_type,self.ip,self.port)
+                metrics.observe_mt_latency(self.name, time.perf_counter()-start, len(batch))
+            for i, translation in zip(batch, translated):
+                translations[i]=translation
+                if self.memory is not None:
+                    self.memory.add(self.name, segments[i], translation)
+        return translations
+
+
+class PivotEngine():
+    """
+    Translates through two engines of mtSystems.yaml, for language pairs that
+    no engine covers:
+
+        - name: spa-ast
+          server_type: pivot
+          engines: [spa-cat, cat-ast]
+          source_suffix: es
+          target_suffix: ast
+
+    The segments are translated in sub-batches of pivot_batch_size segments
+    (8 by default), and every sub-batch goes to the second engine as soon as
+    the first engine returns it, while the first engine translates the next
+    one. So the time of a document is close to that of the slower engine,
+    not the sum of both. The intermediate translations are kept in a
+    TranslationCache, in the JSON lines file pivot_cache if it is set.
+    """
+
+    def __init__(self, config, engines):
+        self.name=config["name"]
+        self.server_type=config["server_type"]
+        self.source_suffix=config["source_suffix"]
+        self.target_suffix=config["target_suffix"]
+        self.config=config
+        for name in config["engines"]:
+            if name not in engines:
+                raise ValueError(f"Pivot engine {self.name}: unknown engine {name}")
+        self.first=engines[config["engines"][0]]
+        self.second=engines[config["engines"][1]]
+        # Tikal is configured with the server of the first engine
+        self.ip=self.first.ip
+        self.port=self.first.port
+        self.max_batch_tokens=config.get("max_batch_tokens")
+        self.batch_size=config.get("pivot_batch_size", 8)
+        self.cache=TranslationCache(config.get("pivot_cache"))
+
+    def translate(self, segment):
+        return self.translate_batch([segment])[0]
+
+    def translate_batch(self, segments):
+        chunks=[segments[start:start+self.batch_size] for start in range(0, len(segments), self.batch_size)]
+        if len(chunks)<=1:
+            return self.second.translate_batch(self.cache.translate_batch(self.first, segments)) if segments else []
+        # the second stage runs in another thread, with the priority and user of this one
+        priority=current_priority()
+        user=current_user()
+
+        def second_stage(pivot):
+            with scheduling(priority, user):
+                return self.second.translate_batch(pivot)
+
+        translations=[]
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="MTUOC-pivot") as executor:
+            futures=[executor.submit(second_stage, self.cache.translate_batch(self.first, chunk)) for chunk in chunks]
+            for future in futures:
+                translations.extend(future.result())
+        return translations
+
+
+def load_engines(path="mtSystems.yaml"):
+    """Returns a dictionary engine name -> MTEngine or PivotEngine, in the order of the configuration file."""
+    systems=load_mt_systems(path)
+    servers={system["name"]: MTEngine(system) for system in systems if system["server_type"]!="pivot"}
+    engines={}
+    for system in systems:
+        if system["server_type"]=="pivot":
+            # a pivot engine can chain the engines with a server and the pivot engines defined before it
+            engines[system["name"]]=PivotEngine(system, dict(servers, **engines))
+        else:
+            engines[system["name"]]=servers[system["name"]]
+    return engines
@@ -0,0 +1,421 @@
+import os
+import re
+import shutil
+import tempfile
+import platform
+import hashlib
+import time
+import contextlib
+
+from MTUOC_tikal_translate import Tikal
+from MTUOC_translation_cache import TranslationCache
+from MTUOC_xliff import XliffDocument, strip_tags, escape_text, unescape_text
+from MTUOC_tag_protection import protect, restore
+from MTUOC_metrics import metrics
+from MTUOC_engines import length_batches
+from MTUOC_scheduler import scheduling, SMALL_FILES, BULK, SMALL_FILE_SEGMENTS
+from MTUOC_package import estimate_memory, strip_binaries, restore_binaries, memory_budget
+from MTUOC_admission import document_queue, QueueFull
+from MTUOC_profiling import job_profiler
+from MTUOC_validation import DocumentValidator
+
+# The cleaners (python-docx, odfdo, lxml) are imported when a document of
+# their format is translated, so that importing this module is fast
+
+# Seconds after which the checkpoint of a failed or abandoned job is removed
+CHECKPOINT_MAX_AGE = 7*24*3600
+
+
+def make_tikal(engine, srx_file="segment.srx"):
+    """Returns a Tikal translator configured for the given MTEngine."""
+    traductor=Tikal()
+    traductor.set_path("./tikalMTUOC.sh")
+    traductor.set_sl(engine.source_suffix)
+    traductor.set_tl(engine.target_suffix)
+    traductor.set_srx_file(srx_file)
+    traductor.set_ip(engine.ip)
+    traductor.set_port(engine.port)
+
+    os_name = platform.system()
+    if os_name=="Linux":
+        traductor.set_path("./tikalMTUOC.sh")
+    if os_name=="Windows":
+        traductor.set_path("tikalWin.bat")
+    return traductor
+
+
+def job_key(filepath, engine):
+    """Identifies a translation job by the content of the file and the engine."""
+    digest=hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(1024*1024), b""):
+            digest.update(chunk)
+    digest.update(("\n"+engine.name+"\n"+engine.source_suffix+"\n"+engine.target_suffix).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def is_valid_output(filepath, validator=None):
+    """Checks that a translated document is structurally valid (see MTUOC_validation)."""
+    if validator is None:
+        validator = DocumentValidator()
+    return validator.is_valid(filepath)
+
+
+class XliffTranslator():
+    """
+    Translates the segments of an XLIFF file extracted by Tikal.
+
+    Segments are sent to the MT engine in batches through checkpoint, a
+    TranslationCache that records every translated segment as soon as it is
+    received, so only the segments not yet in it are requested.
+
+    Unless the engine is configured with tag_protection: false, the inline
+    codes, URLs, e-mails and numbers are replaced by placeholders before MT
+    and restored afterwards (see MTUOC_tag_protection), so that the engine
+    cannot break them. The fallback for broken inline markup works at the
+    paragraph (trans-unit) level: a paragraph whose translations do not
+    contain exactly the inline codes of the source is translated again as
+    plain text, while all the other paragraphs keep their formatted
+    translations.
+    """
+
+    def __init__(self, xlf_path, engine, checkpoint, batch_size=32):
+        self.xlf_path=xlf_path
+        self.engine=engine
+        self.checkpoint=checkpoint
+        self.batch_size=batch_size
+        self.document=XliffDocument(xlf_path)
+        # segments with only whitespace, tags or punctuation are left as they are
+        self.segments=[segment for segment in self.document.segments() if re.search(r"\w", strip_tags(segment.source_text))]
+        self.translations={}
+        self.plain_translations={}
+        self.plain_units=set()
+        # every segment sent to the checkpoint and its translation, to be kept in the document cache
+        self.used={}
+        # inline tags, URLs, e-mails and numbers are sent to the engine as placeholders
+        self.protect=engine.config.get("tag_protection", True)
+
+    def translate_batches(self, texts):
+        translations=[None]*len(texts)
+        # batches of segments of similar length, translated in that order and put back in document order
+        for indexes in length_batches(texts, self.batch_size, self.engine.max_batch_tokens):
+            batch=[texts[i].strip() for i in indexes]
+            if self.protect:
+                protected=[protect(text) for text in batch]
+                batch=[text for text, originals in protected]
+            # the engine receives & < > instead of the entities of the XLIFF, which it could break
+            batch=[unescape_text(text) for text in batch]
+            translated=self.checkpoint.translate_batch(self.engine, batch)
+            self.used.update(zip(batch, translated))
+            translated=[escape_text(translation) for translation in translated]
+            if self.protect:
+                translated=[restore(translation, text, originals) for translation, (text, originals) in zip(translated, protected)]
+            for i, translation in zip(indexes, translated):
+                translations[i]=translation
+        # keep the leading and trailing whitespace of the source, which MT engines drop
+        return [text[:len(text)-len(text.lstrip())]+translation.strip()+text[len(text.rstrip()):] for text, translation in zip(texts, translations)]
+
+    def translate(self):
+        """Translates all the segments, and marks the paragraphs whose inline codes were broken by MT."""
+        texts=[segment.source_text for segment in self.segments]
+        for index, translation in enumerate(self.translate_batches(texts)):
+            self.translations[index]=translation
+            if not self.segments[index].set_translation(translation):
+                self.plain_units.add(self.segments[index].unit_id)
+        self.translate_plain()
+
+    def translate_plain(self):
+        """Translates as plain text the segments of the paragraphs in plain_units."""
+        pending=[index for index, segment in enumerate(self.segments)
+                 if segment.unit_id in self.plain_units and index not in self.plain_translations]
+        if not pending:
+            return
+        print(f"Translating {len(self.plain_units)} paragraphs without inline codes")
+        texts=[escape_text(strip_tags(self.segments[index].source_text)) for index in pending]
+        for index, translation in zip(pending, self.translate_batches(texts)):
+            self.plain_translations[index]=translation
+
+    def units_with_codes(self):
+        """Paragraphs that keep inline codes in their translation, in document order."""
+        units=[]
+        for segment in self.segments:
+            if segment.has_codes() and segment.unit_id not in self.plain_units and segment.unit_id not in units:
+                units.append(segment.unit_id)
+        return units
+
+    def apply(self, formatted_units=None):
+        """
+        Writes the translations in the XLIFF file. If formatted_units is given,
+        the paragraphs with inline codes that are not in it keep the source
+        text, which Tikal can always merge.
+        """
+        for index, segment in enumerate(self.segments):
+            if segment.unit_id in self.plain_units:
+                segment.set_plain_translation(self.plain_translations[index])
+            elif formatted_units is None or segment.unit_id in formatted_units or not segment.has_codes():
+                segment.set_translation(self.translations[index])
+            else:
+                segment.set_translation(segment.source_text)
+        self.document.save(self.xlf_path)
+
+
+def merge_and_validate(traductor, xlf_path, job=None, validator=None):
+    """
+    Merges a translated XLIFF file with Tikal. Returns the translated document
+    path if it is valid, otherwise None. A DocumentValidator of the source
+    document also checks that no paragraph was lost in the merge.
+    """
+    with metrics.timer("merge", job):
+        translated=traductor.merge(xlf_path)
+    with metrics.timer("validation", job):
+        if is_valid_output(translated, validator):
+            return translated
+    return None
+
+
+def find_broken_units(translator, traductor, max_merges=16, job=None, validator=None):
+    """
+    Finds the paragraphs whose inline markup makes the merged document invalid,
+    by bisection: a group of paragraphs is merged with its translations while
+    the rest of the formatted paragraphs keep their source text. If the budget
+    of Tikal merges runs out, the remaining suspicious paragraphs are returned.
+    """
+    merges=[0]
+
+    def merges_with(units):
+        merges[0]+=1
+        translator.apply(set(units))
+        return merge_and_validate(traductor, translator.xlf_path, job, validator) is not None
+
+    def search(units):
+        # units is a group known to break the merge
+        if len(units)==1 or merges[0]>=max_merges:
+            return set(units)
+        half=len(units)//2
+        broken=set()
+        for group in (units[:half], units[half:]):
+            if not merges_with(group):
+                broken|=search(group)
+        # if both halves merge on their own, the group only breaks as a whole
+        return broken or set(units)
+
+    units=translator.units_with_codes()
+    if not units:
+        return set()
+    return search(units)
+
+
+def translate_with_tikal(filepath, traductor, engine, checkpoint, batch_size=32, job=None, segments=None):
+    """
+    Extracts, translates and merges a file with Tikal. Returns the path of the
+    translated file. If segments is a dictionary, the segment translations
+    used are added to it.
+    """
+    # the extraction time includes the start of the JVM and the segmentation
+    with metrics.timer("extraction", job):
+        xlf_path=traductor.extract(filepath)
+    if xlf_path is None or not os.path.exists(xlf_path):
+        raise RuntimeError(f"Tikal could not extract the segments of {filepath}")
+    translator=XliffTranslator(xlf_path, engine, checkpoint, batch_size)
+    # the merged documents are validated against the document given to Tikal
+    validator=DocumentValidator(filepath)
+    metrics.add_job_segments(job, len(translator.segments))
+    # big documents give way to interactive requests and small documents in the MT servers
+    priority=SMALL_FILES if len(translator.segments)<=SMALL_FILE_SEGMENTS else BULK
+    with metrics.timer("translation", job), scheduling(priority):
+        translator.translate()
+    translator.apply()
+    translated=merge_and_validate(traductor, xlf_path, job, validator)
+    if translated is not None:
+        if segments is not None:
+            segments.update(translator.used)
+        return translated
+
+    print("Translated document is invalid. Looking for the paragraphs that break the merge...")
+    with metrics.timer("fallback", job):
+        broken=find_broken_units(translator, traductor, job=job, validator=validator)
+        print(f"Removing the inline codes of {len(broken)} paragraphs and retrying...")
+        translator.plain_units|=broken
+        with scheduling(priority):
+            translator.translate_plain()
+    translator.apply()
+    translated=merge_and_validate(traductor, xlf_path, job, validator)
+    if translated is None:
+        raise RuntimeError(f"The translation of {filepath} could not be merged into a valid document")
+    if segments is not None:
+        segments.update(translator.used)
+    return translated
+
+
+def clean_package(cleaner, filepath, workdir, filextension):
+    """
+    Cleans an office document with cleaner(input, output) without loading its
+    images and other binary parts. Returns the path of the cleaned document.
+    """
+    stripped_path = os.path.join(workdir, "tempfile" + filextension)
+    cleaned_path = os.path.join(workdir, "tempfile.stripped" + filextension)
+    clean_path = os.path.join(workdir, "tempfile.clean" + filextension)
+    stripped = strip_binaries(filepath, stripped_path)
+    cleaner(stripped_path, cleaned_path)
+    restore_binaries(filepath, cleaned_path, clean_path, stripped)
+    return clean_path
+
+
+def translate_document(filepath, filextension, workdir, traductor, engine, checkpoint, batch_size=32, job=None, segments=None):
+    """Cleans (according to the format) and translates a document in workdir. Returns the path of the translated file."""
+    if filextension == ".docx":
+        print("DOCX")
+        from MTUOC_cleanDOCX import DocxCleaner
+        with metrics.timer("cleaning", job):
+            clean_docx = clean_package(DocxCleaner().clean_docx, filepath, workdir, filextension)
+        return translate_with_tikal(clean_docx, traductor, engine, checkpoint, batch_size, job, segments)
+
+    elif filextension in [".odt", ".odf"]:
+        print("ODT")
+        from MTUOC_cleanODT import OdtCleaner
+        with metrics.timer("cleaning", job):
+            clean_odt = clean_package(OdtCleaner().clean_odt, filepath, workdir, filextension)
+        return translate_with_tikal(clean_odt, traductor, engine, checkpoint, batch_size, job, segments)
+
+    elif filextension == ".pptx":
+        print("PPTX")
+        from MTUOC_cleanPPTX import PptxCleaner
+        # PptxCleaner only parses the XML parts and copies the rest from zip to zip
+        clean_pptx = os.path.join(workdir, "tempfile.clean.pptx")
+        with metrics.timer("cleaning", job):
+            PptxCleaner().clean_pptx(filepath, clean_pptx)
+        return translate_with_tikal(clean_pptx, traductor, engine, checkpoint, batch_size, job, segments)
+
+    tempfile_other = os.path.join(workdir, "tempfile" + filextension)
+    shutil.copy(filepath, tempfile_other)
+    return translate_with_tikal(tempfile_other, traductor, engine, checkpoint, batch_size, job, segments)
+
+
+def remove_old_checkpoints(checkpoint_dir, max_age=CHECKPOINT_MAX_AGE):
+    """Removes the checkpoints of the jobs that failed or were abandoned more than max_age seconds ago."""
+    oldest = time.time() - max_age
+    for name in os.listdir(checkpoint_dir):
+        path = os.path.join(checkpoint_dir, name)
+        # a checkpoint in use is written on every batch, so it is never old
+        with contextlib.suppress(OSError):
+            if os.path.getmtime(path) < oldest:
+                os.remove(path)
+
+
+def output_name(filepath):
+    """Name of the translated file of filepath: document.docx -> document.out.docx"""
+    filename, filextension = os.path.splitext(os.path.basename(filepath))
+    return filename + ".out" + filextension.lower()
+
+
+def translate_file(filepath, engine, outpath=None, checkpoint_dir="checkpoints", batch_size=32, document_cache=None, on_queued=None, store=None):
+    """
+    Translates a file with an MTEngine and returns the path of the translated file.
+
+    DOCX, ODT and PPTX files are cleaned of visually irrelevant runs/spans before
+    translation. Tikal extracts the segments, which are translated in batches
+    and merged back. Every translated segment is saved in a checkpoint file,
+    named after the content of the file and the engine, so if the translation
+    is interrupted (Tikal or the MT server fails), translating the same file
+    again only requests the segments that were not translated yet. The
+    checkpoint is removed when the file has been translated, and the
+    checkpoints of failed jobs after CHECKPOINT_MAX_AGE seconds. A relative
+    checkpoint_dir is taken from the directory of this module. With a store
+    (see MTUOC_store), the segments are kept in its shared translation cache
+    instead, which is not removed: any process can resume the translation,
+    and segments translated for other documents are not translated again.
+
+    If the translated document is invalid, only the paragraphs whose inline
+    markup breaks the merge are translated again as plain text (see
+    XliffTranslator). All the intermediate files are created in a private
+    temporary directory of the system, so several files can be translated at
+    the same time, also from read-only directories.
+    Every job waits for its turn in document_queue (see MTUOC_admission),
+    calling on_queued(position) while it waits, or fails with QueueFull if
+    too many documents are waiting. Then it reserves the memory it is
+    expected to need from memory_budget (see MTUOC_package) and waits for
+    it, or fails with MemoryBudgetExceeded if the document is too large for
+    the budget.
+
+    With a DocumentCache, a file that was already translated with the same
+    engine is returned from the cache, and a new version of a file reuses
+    the segment translations of the previous version. If job_profiler is
+    enabled, the processing of the file is profiled (see MTUOC_profiling).
+    """
+    filepath = os.path.abspath(filepath)
+    if not os.path.exists(filepath):
+        raise FileNotFoundError(f"Please select a valid file path: {filepath}")
+
+    filedir = os.path.dirname(filepath)
+    filextension = os.path.splitext(filepath)[1].lower()
+    if outpath is None:
+        outpath = os.path.join(filedir, output_name(filepath))
+
+    # relative to the directory of the package, not to the working directory of the caller
+    checkpoint_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), checkpoint_dir)
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    key = job_key(filepath, engine)
+    checkpoint_path = os.path.join(checkpoint_dir, key + ".jsonl")
+    job = key[:12]
+    metrics.start_job(job, os.path.basename(filepath), engine.name)
+    started = time.perf_counter()
+
+    if document_cache is not None:
+        cached = document_cache.get(key, filextension)
+        if cached is not None:
+            shutil.copy(cached, outpath)
+            metrics.update_job(job, status="done", cached=True, total_s=round(time.perf_counter()-started, 3))
+            metrics.count("document_cache_hits_total")
+            return outpath
+
+    remove_old_checkpoints(checkpoint_dir)
+    checkpoint = None
+    workdir = None
+    segments = {}
+    try:
+        if store is None:
+            checkpoint = TranslationCache(checkpoint_path)
+            if len(checkpoint):
+                print(f"Resuming translation of {filepath}: {len(checkpoint)} segments already translated")
+        else:
+            # the shared cache holds the segments of all the documents, not of this one
+            checkpoint = TranslationCache(store=store)
+        if document_cache is not None:
+            # the unchanged segments of a new version of the document are not translated again
+            checkpoint.preload(engine.name, document_cache.previous_segments(filepath, engine))
+
+        traductor = make_tikal(engine)
+        # in the system temporary directory, as the directory of the file may be read-only
+        workdir = tempfile.mkdtemp(prefix="mtuoc-")
+        # wait for a free document worker, and then for the memory needed by the job
+        needed_mb = estimate_memory(filepath)
+        with document_queue.admit(on_queued), memory_budget.reserve(needed_mb), job_profiler.profile(job) as profiled:
+            if profiled:
+                metrics.update_job(job, profiled=True)
+            if memory_budget.total_mb is not None:
+                # the JVM keeps its default heap unless the memory of the jobs is bounded
+                traductor.set_java_opts(f"-Xmx{needed_mb}m")
+            translated = translate_document(filepath, filextension, workdir, traductor, engine, checkpoint, batch_size, job, segments)
+
+        if translated is None or not os.path.exists(translated):
+            raise FileNotFoundError(f"Translated file not found: {translated}")
+        shutil.copy(translated, outpath)
+    except Exception as e:
+        metrics.update_job(job, status="failed", error=str(e), total_s=round(time.perf_counter()-started, 3))
+        metrics.count("jobs_rejected_total" if isinstance(e, QueueFull) else "jobs_failed_total")
+        raise
+    finally:
+        if checkpoint is not None:
+            checkpoint.close()
+        if workdir is not None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if store is None:
+        # the same document may be translated by another job at the same time, which shares the checkpoint
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(checkpoint_path)
+    if document_cache is not None:
+        document_cache.put(key, filepath, engine, outpath, segments)
+    metrics.update_job(job, status="done", total_s=round(time.perf_counter()-started, 3))
+    metrics.count("jobs_total")
+    return outpath
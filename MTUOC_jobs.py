@@ -0,0 +1,151 @@
+import os
+import time
+import uuid
+import shutil
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from MTUOC_scheduler import scheduling
+from MTUOC_admission import QueueFull
+from MTUOC_store import MemoryStore
+
+
+class JobRegistry():
+    """
+    Keeps the state of the file translation jobs and runs them on a pool of
+    worker threads.
+
+    Every job gets its own directory under jobs_dir, which holds the uploaded
+    file and the translated file. The state of a job is one of "queued",
+    "running", "done" or "failed". With max_queued, new jobs are rejected
+    with QueueFull while that many jobs are queued.
+
+    The state of the jobs is kept in a store (see MTUOC_store), in memory by
+    default. With a shared store and jobs_dir, every process behind a proxy
+    can report the state of the jobs of the others and serve their files.
+    The queued jobs are also kept in a namespace of their own, so that
+    counting them does not read all the jobs.
+
+    Finished jobs are removed, with their directory, max_age seconds after
+    they finish. The jobs that were queued or running in a process of this
+    machine that no longer exists (e.g. the server was restarted) are marked
+    as failed when the registry is created.
+    """
+
+    # seconds between two removals of expired jobs
+    CLEANUP_INTERVAL=60
+
+    def __init__(self, jobs_dir="jobs", workers=2, max_queued=None, store=None, max_age=24*3600):
+        self.jobs_dir=jobs_dir
+        self.max_queued=max_queued
+        self.max_age=max_age
+        self.store=store if store is not None else MemoryStore()
+        self.lock=threading.Lock()
+        self.executor=ThreadPoolExecutor(max_workers=workers, thread_name_prefix="MTUOC-job")
+        self.owner={"host": socket.gethostname(), "pid": os.getpid()}
+        self.last_cleanup=0
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        self.fail_orphaned()
+
+    def create(self, filename, engine_name, user=None):
+        if self.max_queued is not None and self.queued()>=self.max_queued:
+            raise QueueFull(f"Too many jobs waiting ({self.max_queued}), please try again later")
+        job_id=uuid.uuid4().hex
+        job_dir=os.path.join(self.jobs_dir, job_id)
+        os.makedirs(job_dir)
+        job={
+            "id": job_id,
+            "engine": engine_name,
+            "user": user,
+            "filename": os.path.basename(filename),
+            "status": "queued",
+            "input_path": os.path.join(job_dir, os.path.basename(filename)),
+            "output_path": None,
+            "error": None,
+            "created": time.time(),
+            "finished": None,
+            "owner": self.owner,
+        }
+        self.store.put("jobs", job_id, job)
+        self.store.put("jobs:queued", job_id, job["created"])
+        self.cleanup()
+        return job
+
+    def get(self, job_id):
+        return self.store.get("jobs", job_id)
+
+    def queued(self):
+        return self.store.count("jobs:queued")
+
+    def position(self, job_id):
+        """Position of a queued job in the queue (1 is the next one), None if it is not queued."""
+        created=self.store.get("jobs:queued", job_id)
+        if created is None:
+            return None
+        return 1+sum(1 for other_id, other_created in self.store.items("jobs:queued") if other_created<created)
+
+    def remove(self, job_id):
+        """Removes a job and its files."""
+        self.store.delete("jobs:queued", job_id)
+        self.store.delete("jobs", job_id)
+        shutil.rmtree(os.path.join(self.jobs_dir, job_id), ignore_errors=True)
+
+    def cleanup(self):
+        """Removes the jobs that finished more than max_age seconds ago, at most once every CLEANUP_INTERVAL seconds."""
+        now=time.time()
+        with self.lock:
+            if now-self.last_cleanup<self.CLEANUP_INTERVAL:
+                return
+            self.last_cleanup=now
+        for job_id, job in self.store.items("jobs"):
+            if job["finished"] is not None and job["finished"]<now-self.max_age:
+                self.remove(job_id)
+
+    @staticmethod
+    def process_exists(pid):
+        if os.name=="nt":
+            # os.kill would terminate the process
+            return True
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def fail_orphaned(self):
+        """Marks as failed the unfinished jobs of the processes of this machine that no longer exist."""
+        for job_id, job in self.store.items("jobs"):
+            owner=job.get("owner")
+            if job["status"] not in ("queued", "running") or owner is None or owner["host"]!=self.owner["host"]:
+                continue
+            # the jobs of this process belong to another registry of it
+            if owner["pid"]!=self.owner["pid"] and not self.process_exists(owner["pid"]):
+                self.store.delete("jobs:queued", job_id)
+                self.update(job_id, status="failed", error="The server was stopped before the job finished", finished=time.time())
+
+    def update(self, job_id, **fields):
+        # only the process that runs a job updates it
+        with self.lock:
+            job=self.store.get("jobs", job_id)
+            job.update(fields)
+            self.store.put("jobs", job_id, job)
+
+    def submit(self, job_id, function, *args):
+        """Runs function(input_path, *args) in a worker; it must return the output path."""
+        self.executor.submit(self._run, job_id, function, *args)
+
+    def _run(self, job_id, function, *args):
+        self.store.delete("jobs:queued", job_id)
+        self.update(job_id, status="running")
+        try:
+            job=self.get(job_id)
+            # the MT requests of the job are scheduled as those of the user who submitted it
+            with scheduling(user=job["user"]):
+                output_path=function(job["input_path"], *args)
+            self.update(job_id, status="done", output_path=output_path, finished=time.time())
+        except Exception as e:
+            print(f"Error in job {job_id}: {e}")
+            self.update(job_id, status="failed", error=str(e), finished=time.time())
@@ -0,0 +1,136 @@
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+"""
+    Timing instrumentation for the translation pipeline.
+
+    The pipeline records how long every stage takes (cleaning, extraction,
+    translation, merge, validation), per job and in total, and the latency
+    of every request to an MT engine. The figures are kept in memory by the
+    module-level registry metrics, which can be exported in the Prometheus
+    text format (see the /metrics endpoint of MTUOC_translate_api.py) or
+    shown in the admin panel of the web interface.
+
+    Note that the extraction stage includes the start of the Tikal JVM and
+    the segmentation of the document, which happen in the same process.
+"""
+
+# Upper bounds, in seconds, of the buckets of the MT latency histograms
+LATENCY_BUCKETS=[0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+
+def label_value(value):
+    """Escapes a label value for the Prometheus text format."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics():
+    def __init__(self, max_jobs=100):
+        self.lock=threading.Lock()
+        self.max_jobs=max_jobs
+        self.stages={}
+        self.latencies={}
+        self.counters={}
+        self.jobs=OrderedDict()
+
+    def observe_stage(self, stage, seconds, job=None):
+        with self.lock:
+            count, total=self.stages.get(stage, (0, 0.0))
+            self.stages[stage]=(count+1, total+seconds)
+            if job is not None and job in self.jobs:
+                timings=self.jobs[job]["stages"]
+                timings[stage]=timings.get(stage, 0.0)+seconds
+
+    @contextmanager
+    def timer(self, stage, job=None):
+        """Measures the time spent in the with block as the given stage."""
+        start=time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(stage, time.perf_counter()-start, job)
+
+    def observe_mt_latency(self, engine_name, seconds, segments=1):
+        with self.lock:
+            histogram=self.latencies.get(engine_name)
+            if histogram is None:
+                histogram={"buckets": [0]*len(LATENCY_BUCKETS), "count": 0, "sum": 0.0, "segments": 0}
+                self.latencies[engine_name]=histogram
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds<=bound:
+                    histogram["buckets"][i]+=1
+            histogram["count"]+=1
+            histogram["sum"]+=seconds
+            histogram["segments"]+=segments
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name]=self.counters.get(name, 0)+value
+
+    def start_job(self, job, filename, engine_name):
+        with self.lock:
+            self.jobs[job]={"job": job, "filename": filename, "engine": engine_name, "status": "running",
+                            "started": time.time(), "segments": 0, "stages": {}}
+            while len(self.jobs)>self.max_jobs:
+                self.jobs.popitem(last=False)
+
+    def update_job(self, job, **fields):
+        with self.lock:
+            if job in self.jobs:
+                self.jobs[job].update(fields)
+
+    def add_job_segments(self, job, segments):
+        with self.lock:
+            if job in self.jobs:
+                self.jobs[job]["segments"]+=segments
+
+    def stage_summary(self):
+        """List of dictionaries with the count, total and mean time of every stage."""
+        with self.lock:
+            return [{"stage": stage, "count": count, "total_s": round(total, 3), "mean_s": round(total/count, 3)}
+                    for stage, (count, total) in self.stages.items()]
+
+    def latency_summary(self):
+        with self.lock:
+            return [{"engine": engine, "requests": h["count"], "segments": h["segments"],
+                     "mean_s": round(h["sum"]/h["count"], 3) if h["count"] else 0.0}
+                    for engine, h in self.latencies.items()]
+
+    def recent_jobs(self):
+        with self.lock:
+            return [dict(job, stages={stage: round(seconds, 3) for stage, seconds in job["stages"].items()})
+                    for job in reversed(self.jobs.values())]
+
+    def prometheus(self):
+        """Exports the metrics in the Prometheus text exposition format."""
+        lines=[]
+        with self.lock:
+            lines.append("# HELP mtuoc_stage_seconds Time spent in each stage of the file pipeline.")
+            lines.append("# TYPE mtuoc_stage_seconds summary")
+            for stage, (count, total) in self.stages.items():
+                label=label_value(stage)
+                lines.append(f'mtuoc_stage_seconds_count{{stage="{label}"}} {count}')
+                lines.append(f'mtuoc_stage_seconds_sum{{stage="{label}"}} {total:.6f}')
+            lines.append("# HELP mtuoc_mt_request_seconds Latency of the requests to the MT engines.")
+            lines.append("# TYPE mtuoc_mt_request_seconds histogram")
+            for engine, h in self.latencies.items():
+                label=label_value(engine)
+                for bound, count in zip(LATENCY_BUCKETS, h["buckets"]):
+                    lines.append(f'mtuoc_mt_request_seconds_bucket{{engine="{label}",le="{bound}"}} {count}')
+                lines.append(f'mtuoc_mt_request_seconds_bucket{{engine="{label}",le="+Inf"}} {h["count"]}')
+                lines.append(f'mtuoc_mt_request_seconds_count{{engine="{label}"}} {h["count"]}')
+                lines.append(f'mtuoc_mt_request_seconds_sum{{engine="{label}"}} {h["sum"]:.6f}')
+            lines.append("# HELP mtuoc_mt_segments_total Segments sent to the MT engines.")
+            lines.append("# TYPE mtuoc_mt_segments_total counter")
+            for engine, h in self.latencies.items():
+                label=label_value(engine)
+                lines.append(f'mtuoc_mt_segments_total{{engine="{label}"}} {h["segments"]}')
+            for name, value in self.counters.items():
+                lines.append(f"# TYPE mtuoc_{name} counter")
+                lines.append(f"mtuoc_{name} {value}")
+        return "\n".join(lines)+"\n"
+
+
+metrics=Metrics()
@@ -0,0 +1,252 @@
+import re
+import json
+import random
+import asyncio
+import argparse
+import threading
+import xmlrpc.client
+from xml.parsers.expat import ExpatError
+from urllib.parse import urlparse, parse_qs
+
+"""
+    A local stand-in for the MT servers, for benchmarks and load tests.
+
+    It speaks the protocols used by TextBox_translator.py:
+
+        MTUOC      POST /translate             {"src": "..."} -> {"tgt": "..."}
+        NMTWizard  POST /translate             {"src": [{"text": "..."}]} -> {"tgt": [[{"text": "..."}]]}
+        OpenNMT    POST /translator/translate  [{"src": "..."}] -> [[{"tgt": "..."}]]
+        ModernMT   GET  /translate?q=...       -> {"data": {"translation": "..."}}
+        Moses      POST /RPC2                  XML-RPC translate({"text": ...}) and system.multicall
+
+    The "translation" is the source segment itself (mode "echo") or the
+    source with the text outside the tags in upper case (mode "upper"), so
+    the inline tags always survive.
+
+    The time of a request imitates a GPU engine: a fixed latency per request
+    plus a latency per token of the padded batch, that is, the number of
+    segments times the length in tokens of the longest one. At most
+    concurrency requests are translated at the same time; the rest wait in a
+    queue of max_queue requests, and are rejected with 503 when the queue is
+    full. Failures can be injected: a fraction of the requests answers with
+    500 (failure_rate) or closes the connection without answering
+    (drop_rate).
+"""
+
+
+class MockMTServer():
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, mode="echo", token_latency=0.0,
+                 concurrency=None, max_queue=None, failure_rate=0.0, drop_rate=0.0, seed=None):
+        self.host=host
+        self.port=port
+        self.latency=latency
+        self.mode=mode
+        self.token_latency=token_latency
+        self.concurrency=concurrency
+        self.max_queue=max_queue
+        self.failure_rate=failure_rate
+        self.drop_rate=drop_rate
+        self.random=random.Random(seed)
+        self.requests=0
+        self.segments=0
+        self.rejected=0
+        self.failed=0
+        self.waiting=0
+        self.active=0
+        self.max_active=0
+        self.server=None
+        self.loop=None
+        self.thread=None
+        self.semaphore=None
+        self.connections=set()
+
+    def translate(self, text):
+        if self.mode=="upper":
+            return re.sub(r"(^|>)([^<]*)", lambda match: match.group(1)+match.group(2).upper(), text)
+        return text
+
+    def parse(self, method, path, query, body):
+        """Returns the protocol and the list of segments of a request, or None if it is not understood."""
+        if method=="GET" and path=="/translate":
+            return "ModernMT", [query.get("q", [""])[0]]
+        if method!="POST":
+            return None
+        if path=="/RPC2":
+            params, method_name=xmlrpc.client.loads(body)
+            if method_name=="system.multicall":
+                return "Moses-multicall", [call["params"][0]["text"] for call in params[0]]
+            return "Moses", [params[0]["text"]]
+        request=json.loads(body or b"null")
+        if path=="/translator/translate":
+            return "OpenNMT", [item["src"] for item in request]
+        if path=="/translate":
+            if isinstance(request.get("src"), list):
+                return "NMTWizard", [item["text"] for item in request["src"]]
+            return "MTUOC", [request.get("src", "")]
+        return None
+
+    def answer(self, protocol, segments, translations):
+        """Returns the content type and body of the answer to a request."""
+        if protocol=="Moses":
+            return "text/xml", xmlrpc.client.dumps(({"text": translations[0]},), methodresponse=True).encode("utf-8")
+        if protocol=="Moses-multicall":
+            results=[[{"text": translation}] for translation in translations]
+            return "text/xml", xmlrpc.client.dumps((results,), methodresponse=True).encode("utf-8")
+        if protocol=="ModernMT":
+            answer={"data": {"translation": translations[0]}}
+        elif protocol=="OpenNMT":
+            answer=[[{"src": segment, "tgt": translation} for segment, translation in zip(segments, translations)]]
+        elif protocol=="NMTWizard":
+            answer={"tgt": [[{"text": translation}] for translation in translations]}
+        else:
+            answer={"src": segments[0], "tgt": translations[0]}
+        return "application/json", json.dumps(answer, ensure_ascii=False).encode("utf-8")
+
+    def request_time(self, segments):
+        padded_tokens=len(segments)*max(len(segment.split()) for segment in segments) if segments else 0
+        return self.latency+self.token_latency*padded_tokens
+
+    async def process(self, method, path, query, body):
+        """Returns the status, content type and body of the answer, or None to drop the connection."""
+        try:
+            parsed=self.parse(method, path, query, body)
+        except (ValueError, KeyError, TypeError, IndexError, xmlrpc.client.ResponseError, ExpatError):
+            return 400, "text/plain", b"Invalid request"
+        if parsed is None:
+            return 404, "text/plain", b"Not found"
+        protocol, segments=parsed
+
+        if self.max_queue is not None and self.waiting>=self.max_queue:
+            self.rejected+=1
+            return 503, "text/plain", b"Server busy"
+        self.waiting+=1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting-=1
+        try:
+            self.active+=1
+            self.max_active=max(self.max_active, self.active)
+            self.requests+=1
+            self.segments+=len(segments)
+            await asyncio.sleep(self.request_time(segments))
+        finally:
+            self.active-=1
+            self.semaphore.release()
+
+        failure=self.random.random()
+        if failure<self.drop_rate:
+            self.failed+=1
+            return None
+        if failure<self.drop_rate+self.failure_rate:
+            self.failed+=1
+            return 500, "text/plain", b"Injected failure"
+        content_type, answer=self.answer(protocol, segments, [self.translate(segment) for segment in segments])
+        return 200, content_type, answer
+
+    async def handle(self, reader, writer):
+        # HTTP/1.1 with keep-alive: serve requests until the client closes the connection
+        self.connections.add(asyncio.current_task())
+        try:
+            while True:
+                request_line=await reader.readline()
+                if not request_line:
+                    break
+                method, target, version=request_line.decode("latin-1").split()
+                headers={}
+                while True:
+                    line=await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, value=line.decode("latin-1").split(":", 1)
+                    headers[name.strip().lower()]=value.strip()
+                body=await reader.readexactly(int(headers.get("content-length", 0)))
+                url=urlparse(target)
+
+                response=await self.process(method, url.path, parse_qs(url.query), body)
+                if response is None:
+                    break
+                status, content_type, data=response
+                reason={200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error", 503: "Service Unavailable"}[status]
+                writer.write(f"HTTP/1.1 {status} {reason}\r\n"
+                             f"Content-Type: {content_type}\r\nContent-Length: {len(data)}\r\n\r\n".encode("latin-1")+data)
+                await writer.drain()
+                if headers.get("connection", "").lower()=="close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError, asyncio.CancelledError):
+            pass
+        finally:
+            self.connections.discard(asyncio.current_task())
+            writer.close()
+
+    async def start(self):
+        # a concurrency of None means no limit
+        self.semaphore=asyncio.Semaphore(self.concurrency or 2**30)
+        self.server=await asyncio.start_server(self.handle, self.host, self.port)
+        self.port=self.server.sockets[0].getsockname()[1]
+        return self.port
+
+    def start_in_thread(self):
+        """Runs the server in a background thread. Returns the port it listens on."""
+        started=threading.Event()
+
+        def run():
+            self.loop=asyncio.new_event_loop()
+            self.loop.run_until_complete(self.start())
+            started.set()
+            self.loop.run_forever()
+
+        self.thread=threading.Thread(target=run, daemon=True)
+        self.thread.start()
+        started.wait()
+        return self.port
+
+    async def shutdown(self):
+        self.server.close()
+        # idle keep-alive connections are waiting for a next request that will not come
+        for task in list(self.connections):
+            task.cancel()
+        await asyncio.gather(*self.connections, return_exceptions=True)
+
+    def stop(self):
+        if self.loop is not None:
+            asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.loop.close()
+
+    def stats(self):
+        return {"requests": self.requests, "segments": self.segments, "rejected": self.rejected,
+                "failed": self.failed, "max_concurrent": self.max_active}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock MT server speaking the MTUOC, OpenNMT, NMTWizard, ModernMT and Moses protocols.")
+    parser.add_argument("--host", default="127.0.0.1", help="Host to listen on")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before answering each request")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Additional seconds per token of the padded batch")
+    parser.add_argument("--concurrency", type=int, default=None, help="Requests translated at the same time (default: no limit)")
+    parser.add_argument("--max-queue", type=int, default=None, help="Requests waiting before answering 503 (default: no limit)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of requests answered with an error 500")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Fraction of requests whose connection is closed without answer")
+    parser.add_argument("--mode", choices=["echo", "upper"], default="echo", help="How the source is 'translated'")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for the failure injection")
+    args = parser.parse_args()
+
+    server=MockMTServer(args.host, args.port, args.latency, args.mode, args.token_latency,
+                        args.concurrency, args.max_queue, args.failure_rate, args.drop_rate, args.seed)
+
+    async def serve():
+        await server.start()
+        print(f"Mock MT server listening on http://{args.host}:{server.port}")
+        await server.server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print(server.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import os
+import shutil
+import zipfile
+import threading
+from contextlib import contextmanager
+
+"""
+    Memory-bounded handling of office documents (DOCX, ODT, PPTX).
+
+    These formats are zip packages of XML parts and binary parts (images,
+    embedded objects, fonts). Only the XML parts contain text, but
+    python-docx and odfdo read every part of the package into memory, so a
+    document with 200 MB of images costs at least 200 MB per translation.
+    Before cleaning, the binary parts are replaced by empty placeholders
+    (strip_binaries), and after cleaning they are copied back from the
+    original package, from zip to zip and in chunks (restore_binaries).
+
+    The memory needed to translate a document is estimated from the
+    uncompressed size of its XML parts (estimate_memory), and every job
+    reserves its estimate from the module-level memory_budget before it
+    starts: jobs wait while the budget is in use by other jobs, and jobs
+    that would not fit even alone are rejected with MemoryBudgetExceeded.
+    The budget is unlimited unless the environment variable
+    MTUOC_MEMORY_BUDGET_MB is set, or a command line option (--memory-budget)
+    sets it.
+"""
+
+CHUNK_SIZE=1024*1024
+
+# Parts of a package that are parsed as XML; everything else is copied as is
+XML_EXTENSIONS=(".xml", ".rels")
+
+# Memory used while processing a document, relative to the size of its XML,
+# for the object trees of the cleaners, lxml and the Tikal JVM, which needs
+# MIN_JOB_MB even for small documents
+MEMORY_FACTOR=10
+MIN_JOB_MB=256
+
+
+class MemoryBudgetExceeded(Exception):
+    pass
+
+
+def is_binary_part(name):
+    return name!="mimetype" and not name.endswith("/") and not name.lower().endswith(XML_EXTENSIONS)
+
+
+def save_upload(source, path):
+    """Writes a file-like object to path in chunks. Returns the number of bytes written."""
+    written=0
+    with open(path, "wb") as f:
+        for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+            f.write(chunk)
+            written+=len(chunk)
+    return written
+
+
+def estimate_memory(path):
+    """Estimates the memory, in MB, needed to translate a document."""
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as package:
+            size=sum(item.file_size for item in package.infolist() if not is_binary_part(item.filename))
+    else:
+        size=os.path.getsize(path)
+    return max(MIN_JOB_MB, size*MEMORY_FACTOR//(1024*1024))
+
+
+def strip_binaries(input_path, output_path):
+    """Copies a package replacing its binary parts by empty files. Returns the names of the stripped parts."""
+    stripped=[]
+    with zipfile.ZipFile(input_path) as zin, zipfile.ZipFile(output_path, "w") as zout:
+        for item in zin.infolist():
+            if is_binary_part(item.filename) and item.file_size>0:
+                zout.writestr(item, b"")
+                stripped.append(item.filename)
+            else:
+                with zin.open(item) as source, zout.open(item, "w") as target:
+                    shutil.copyfileobj(source, target, CHUNK_SIZE)
+    return stripped
+
+
+def restore_binaries(original_path, stripped_path, output_path, stripped):
+    """Copies the package stripped_path to output_path, taking the parts in stripped from original_path."""
+    stripped=set(stripped)
+    with zipfile.ZipFile(original_path) as original, zipfile.ZipFile(stripped_path) as zin, \
+            zipfile.ZipFile(output_path, "w") as zout:
+        for item in zin.infolist():
+            source_zip=original if item.filename in stripped else zin
+            source_item=original.getinfo(item.filename) if item.filename in stripped else item
+            with source_zip.open(source_item) as source, zout.open(source_item, "w") as target:
+                shutil.copyfileobj(source, target, CHUNK_SIZE)
+
+
+class MemoryBudget():
+    """
+    A budget of memory, in MB, shared by the jobs running at the same time.
+    A total of None means no limit.
+    """
+
+    def __init__(self, total_mb=None):
+        self.total_mb=total_mb
+        self.used_mb=0
+        self.condition=threading.Condition()
+
+    def set_total(self, total_mb):
+        with self.condition:
+            self.total_mb=total_mb
+            self.condition.notify_all()
+
+    @contextmanager
+    def reserve(self, mb):
+        """Reserves mb for the with block, waiting until they are available."""
+        with self.condition:
+            while self.total_mb is not None and self.used_mb+mb>self.total_mb:
+                if mb>self.total_mb:
+                    raise MemoryBudgetExceeded(f"The document needs about {mb} MB to be translated, and the memory budget is {self.total_mb} MB")
+                self.condition.wait()
+            self.used_mb+=mb
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.used_mb-=mb
+                self.condition.notify_all()
+
+
+memory_budget=MemoryBudget(int(os.environ["MTUOC_MEMORY_BUDGET_MB"]) if os.environ.get("MTUOC_MEMORY_BUDGET_MB") else None)
@@ -0,0 +1,96 @@
+import os
+import io
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+"""
+    Opt-in profiling of file jobs, to find out why a document is slow.
+
+    When the module-level job_profiler is enabled (from the admin panel of
+    the web interface, or with the environment variable MTUOC_PROFILE_JOBS),
+    every file job runs under cProfile and tracemalloc, and three files are
+    stored in a directory per job under profiles/:
+
+        profile.prof      the cProfile statistics, for pstats or snakeviz
+        profile.txt       the functions with the highest cumulative time
+        allocations.txt   the lines that allocated most memory
+
+    The cumulative times tell whether a job spends its time in a cleaner
+    (e.g. DocxCleaner.get_effective_run_format or an OdtCleaner span pass),
+    waiting for Tikal (subprocess) or waiting for the MT server (requests,
+    xmlrpc). Only one job is profiled at a time: the jobs that start while
+    another one is profiled run normally. Before Python 3.12, only the thread
+    of the job is profiled; from 3.12 on, cProfile uses sys.monitoring and
+    also records the other threads that run meanwhile (other jobs, the text
+    translations of the web interface), so their functions can appear in the
+    profile too. The allocations of tracemalloc always include all threads.
+"""
+
+
+class JobProfiler():
+    def __init__(self, directory="profiles", enabled=False, top=40):
+        self.directory=directory
+        self.enabled=enabled
+        self.top=top
+        self.lock=threading.Lock()
+
+    def job_dir(self, job):
+        return os.path.join(self.directory, job)
+
+    @contextmanager
+    def profile(self, job):
+        """Profiles the with block as the given job, if profiling is enabled and no other job is profiled."""
+        if not self.enabled or not self.lock.acquire(blocking=False):
+            yield False
+            return
+        try:
+            # tracemalloc may have been started by someone else, e.g. python -X tracemalloc
+            started_tracemalloc=not tracemalloc.is_tracing()
+            if started_tracemalloc:
+                tracemalloc.start()
+            profiler=cProfile.Profile()
+            profiler.enable()
+            try:
+                yield True
+            finally:
+                profiler.disable()
+                snapshot=tracemalloc.take_snapshot()
+                peak=tracemalloc.get_traced_memory()[1]
+                if started_tracemalloc:
+                    tracemalloc.stop()
+                self.save(job, profiler, snapshot, peak)
+        finally:
+            self.lock.release()
+
+    def save(self, job, profiler, snapshot, peak):
+        job_dir=self.job_dir(job)
+        os.makedirs(job_dir, exist_ok=True)
+        profiler.dump_stats(os.path.join(job_dir, "profile.prof"))
+        summary=io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(self.top)
+        with open(os.path.join(job_dir, "profile.txt"), "w", encoding="utf-8") as f:
+            f.write(summary.getvalue())
+        with open(os.path.join(job_dir, "allocations.txt"), "w", encoding="utf-8") as f:
+            f.write(f"Peak traced memory: {peak/1024/1024:.1f} MB\n\n")
+            for statistic in snapshot.statistics("lineno")[:self.top]:
+                f.write(str(statistic)+"\n")
+
+    def files(self, job):
+        """Paths of the stored files of a profiled job, by name."""
+        job_dir=self.job_dir(job)
+        if not os.path.isdir(job_dir):
+            return {}
+        return {name: os.path.join(job_dir, name) for name in sorted(os.listdir(job_dir))}
+
+    def profiled_jobs(self):
+        """Identifiers of the jobs with a stored profile, most recent first."""
+        if not os.path.isdir(self.directory):
+            return []
+        jobs=[job for job in os.listdir(self.directory) if os.path.isdir(self.job_dir(job))]
+        return sorted(jobs, key=lambda job: os.path.getmtime(self.job_dir(job)), reverse=True)
+
+
+job_profiler=JobProfiler(enabled=bool(os.environ.get("MTUOC_PROFILE_JOBS")))
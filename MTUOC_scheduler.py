@@ -0,0 +1,155 @@
+import itertools
+import threading
+from contextlib import contextmanager
+
+from MTUOC_admission import QueueFull
+
+"""
+    Scheduling of the requests to the MT servers.
+
+    Every MT server (IP and port) has a shared EngineScheduler that limits
+    the requests sent to it at the same time. When the server is busy, the
+    waiting requests are served by priority class:
+
+        INTERACTIVE   text typed in the web interface or sent to /translate
+        SMALL_FILES   documents with at most SMALL_FILE_SEGMENTS segments
+        BULK          big documents and MTUOC_bulk_translate.py
+
+    and within a class, the user with fewer requests served since the
+    server was last idle goes first, so that a user with a big job cannot
+    monopolize the server. A sentence typed in the text box waits at most
+    for one request in progress, not for a whole document.
+
+    The priority and the user are set for the current thread with the
+    scheduling() context manager, so they do not need to be passed through
+    the file pipeline: MTEngine asks the scheduler for a slot before every
+    request.
+
+    With max_waiting, an interactive request that finds that many requests
+    already waiting is rejected with QueueFull. The requests of documents
+    are never rejected, as the documents were admitted before they started
+    (see MTUOC_admission).
+"""
+
+INTERACTIVE=0
+SMALL_FILES=1
+BULK=2
+
+PRIORITY_NAMES={INTERACTIVE: "interactive", SMALL_FILES: "small files", BULK: "bulk"}
+
+# Documents with more segments than this are translated as bulk
+SMALL_FILE_SEGMENTS=500
+
+_context=threading.local()
+
+
+@contextmanager
+def scheduling(priority=None, user=None):
+    """
+    Sets the priority class and the user of the MT requests made in the with
+    block by this thread. A nested block can lower the priority, but not raise
+    it: a small document translated by a bulk job is still bulk.
+    """
+    previous_priority=getattr(_context, "priority", None)
+    previous_user=getattr(_context, "user", None)
+    if priority is not None:
+        _context.priority=priority if previous_priority is None else max(previous_priority, priority)
+    if user is not None:
+        _context.user=user
+    try:
+        yield
+    finally:
+        _context.priority=previous_priority
+        _context.user=previous_user
+
+
+def current_priority():
+    priority=getattr(_context, "priority", None)
+    return INTERACTIVE if priority is None else priority
+
+
+def current_user():
+    return getattr(_context, "user", None)
+
+
+class EngineScheduler():
+    def __init__(self, concurrency=4, max_waiting=None):
+        self.concurrency=concurrency
+        self.max_waiting=max_waiting
+        self.active=0
+        self.waiting=[]
+        self.sequence=itertools.count()
+        # requests served per user since the server was last idle
+        self.served={}
+        self.condition=threading.Condition()
+
+    def next_request(self):
+        return min(self.waiting, key=lambda request: (request[0], self.served.get(request[1], 0), request[2]))
+
+    @contextmanager
+    def slot(self, priority=None, user=None):
+        """Waits until the request can be sent to the server, according to its priority and user."""
+        if priority is None:
+            priority=current_priority()
+        if user is None:
+            user=current_user()
+        request=(priority, user, next(self.sequence))
+        with self.condition:
+            if priority==INTERACTIVE and self.max_waiting is not None and len(self.waiting)>=self.max_waiting:
+                raise QueueFull(f"The MT server is busy ({len(self.waiting)} requests waiting), please try again later")
+            self.waiting.append(request)
+            try:
+                while self.active>=self.concurrency or self.next_request() is not request:
+                    self.condition.wait()
+            except BaseException:
+                # the waiting thread was stopped: the other requests must not wait for it
+                self.waiting.remove(request)
+                self.condition.notify_all()
+                raise
+            self.waiting.remove(request)
+            self.active+=1
+            self.served[user]=self.served.get(user, 0)+1
+            # the next request may also fit
+            self.condition.notify_all()
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.active-=1
+                if not self.active and not self.waiting:
+                    # the shares start again when the server is idle
+                    self.served.clear()
+                self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            waiting={}
+            for priority, user, sequence in self.waiting:
+                waiting[PRIORITY_NAMES[priority]]=waiting.get(PRIORITY_NAMES[priority], 0)+1
+            return {"active": self.active, "waiting": waiting}
+
+
+_schedulers={}
+_schedulers_lock=threading.Lock()
+
+
+def get_scheduler(ip, port, concurrency=4, max_waiting=None):
+    """Returns the scheduler shared by all the engines of the MT server at ip:port."""
+    with _schedulers_lock:
+        scheduler=_schedulers.get((ip, port))
+        if scheduler is None:
+            scheduler=EngineScheduler(concurrency, max_waiting)
+            _schedulers[(ip, port)]=scheduler
+        return scheduler
+
+
+def scheduler_summary():
+    """List of dictionaries with the requests in progress and waiting, per MT server."""
+    with _schedulers_lock:
+        schedulers=list(_schedulers.items())
+    summary=[]
+    for (ip, port), scheduler in schedulers:
+        stats=scheduler.stats()
+        summary.append(dict({"server": f"{ip}:{port}", "active": stats["active"]},
+                            **{name: stats["waiting"].get(name, 0) for name in PRIORITY_NAMES.values()}))
+    return summary
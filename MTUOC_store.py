@@ -0,0 +1,185 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+"""
+    Key-value stores for the state shared by several processes of the
+    translator (Streamlit or API processes behind a proxy): the translation
+    checkpoints (TranslationCache), the index of the DocumentCache and the
+    JobRegistry.
+
+    A store keeps JSON values by namespace and key. Stores are opened from
+    a URL, e.g. in the environment variable MTUOC_STORE:
+
+        memory:                       in the memory of the process (not shared)
+        sqlite:///var/lib/mtuoc.db    an SQLite database in WAL mode, shared by
+                                      the processes of the same machine
+
+    Other stores, e.g. a networked stand-in for several machines, implement
+    the methods of Store and are registered with register_store(scheme,
+    factory), where factory receives the URL.
+"""
+
+
+class Store():
+    """The interface of the stores. Values are anything that can be converted to JSON."""
+
+    def get(self, namespace, key):
+        return self.get_many(namespace, [key]).get(key)
+
+    def get_many(self, namespace, keys):
+        """Returns a dictionary key -> value with the keys that are in the store."""
+        raise NotImplementedError
+
+    def put(self, namespace, key, value):
+        self.put_many(namespace, {key: value})
+
+    def put_many(self, namespace, values):
+        raise NotImplementedError
+
+    def delete(self, namespace, key):
+        raise NotImplementedError
+
+    def clear(self, namespace):
+        raise NotImplementedError
+
+    def items(self, namespace):
+        """Returns a list of (key, value) pairs, in order of insertion or update."""
+        raise NotImplementedError
+
+    def count(self, namespace):
+        return len(self.items(namespace))
+
+
+class MemoryStore(Store):
+    def __init__(self):
+        self.namespaces={}
+        self.lock=threading.Lock()
+
+    def get_many(self, namespace, keys):
+        with self.lock:
+            entries=self.namespaces.get(namespace, {})
+            # the values are kept as JSON, so that they are copies as in the other stores
+            return {key: json.loads(entries[key]) for key in keys if key in entries}
+
+    def put_many(self, namespace, values):
+        with self.lock:
+            entries=self.namespaces.setdefault(namespace, {})
+            for key, value in values.items():
+                entries.pop(key, None)
+                entries[key]=json.dumps(value, ensure_ascii=False)
+
+    def delete(self, namespace, key):
+        with self.lock:
+            self.namespaces.get(namespace, {}).pop(key, None)
+
+    def clear(self, namespace):
+        with self.lock:
+            self.namespaces.pop(namespace, None)
+
+    def items(self, namespace):
+        with self.lock:
+            return [(key, json.loads(value)) for key, value in self.namespaces.get(namespace, {}).items()]
+
+    def count(self, namespace):
+        with self.lock:
+            return len(self.namespaces.get(namespace, {}))
+
+
+class SQLiteStore(Store):
+    """
+    A store in an SQLite database in WAL mode, in which readers do not block
+    the writer, so several processes can share it. Every thread has its own
+    connection.
+    """
+
+    # keys per query in get_many, below the limit of SQL variables
+    MAX_KEYS=500
+
+    def __init__(self, path, timeout=30):
+        self.path=path
+        self.timeout=timeout
+        self.local=threading.local()
+        directory=os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        connection=self.connection()
+        connection.execute("CREATE TABLE IF NOT EXISTS entries (namespace TEXT, key TEXT, value TEXT, updated REAL, "
+                           "PRIMARY KEY (namespace, key)) WITHOUT ROWID")
+        connection.execute("CREATE INDEX IF NOT EXISTS entries_updated ON entries (namespace, updated)")
+
+    def connection(self):
+        connection=getattr(self.local, "connection", None)
+        if connection is None:
+            # autocommit mode: every statement is its own transaction unless BEGIN is used
+            connection=sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection=connection
+        return connection
+
+    def get_many(self, namespace, keys):
+        keys=list(keys)
+        values={}
+        for start in range(0, len(keys), self.MAX_KEYS):
+            chunk=keys[start:start+self.MAX_KEYS]
+            rows=self.connection().execute("SELECT key, value FROM entries WHERE namespace=? AND key IN ("+",".join("?"*len(chunk))+")",
+                                           [namespace]+chunk)
+            for key, value in rows:
+                values[key]=json.loads(value)
+        return values
+
+    def put_many(self, namespace, values):
+        if not values:
+            return
+        connection=self.connection()
+        now=time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany("INSERT OR REPLACE INTO entries (namespace, key, value, updated) VALUES (?, ?, ?, ?)",
+                                   [(namespace, key, json.dumps(value, ensure_ascii=False), now) for key, value in values.items()])
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def delete(self, namespace, key):
+        self.connection().execute("DELETE FROM entries WHERE namespace=? AND key=?", (namespace, key))
+
+    def clear(self, namespace):
+        self.connection().execute("DELETE FROM entries WHERE namespace=?", (namespace,))
+
+    def items(self, namespace):
+        rows=self.connection().execute("SELECT key, value FROM entries WHERE namespace=? ORDER BY updated", (namespace,))
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def count(self, namespace):
+        return self.connection().execute("SELECT COUNT(*) FROM entries WHERE namespace=?", (namespace,)).fetchone()[0]
+
+
+def sqlite_path(url):
+    """sqlite:///abs/path.db -> /abs/path.db, sqlite:relative.db -> relative.db"""
+    path=url[len("sqlite:"):]
+    return path[2:] if path.startswith("//") else path
+
+
+STORE_TYPES={
+    "memory": lambda url: MemoryStore(),
+    "sqlite": lambda url: SQLiteStore(sqlite_path(url)),
+}
+
+
+def register_store(scheme, factory):
+    """Makes open_store open the URLs scheme:... with factory(url)."""
+    STORE_TYPES[scheme]=factory
+
+
+def open_store(url):
+    """Opens the store of a URL (see the module documentation). Returns None if url is empty."""
+    if not url:
+        return None
+    scheme=url.split(":", 1)[0]
+    if scheme not in STORE_TYPES:
+        raise ValueError(f"Unknown store: {url}")
+    return STORE_TYPES[scheme](url)
@@ -0,0 +1,179 @@
+import random
+import zipfile
+import argparse
+from xml.sax.saxutils import escape
+
+"""
+    Generation of synthetic DOCX, ODT and PPTX documents for benchmarks.
+
+    The documents have a given number of paragraphs, and every paragraph is
+    split in a given number of runs/spans (fragmentation). Most of the runs
+    only differ in revision IDs or language attributes, which is what the
+    cleaners merge, and some are bold, which must be kept. DOCX and ODT files
+    are written directly as XML packages; PPTX files are built with
+    python-pptx.
+"""
+
+WORDS=("the translation of documents requires clean segments without visually "
+       "irrelevant tags that split sentences into fragments which are hard to "
+       "place in the target language").split()
+
+
+def sentence(rng, words=12):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize()+"."
+
+
+def fragments(rng, runs):
+    """Splits a paragraph text into runs pieces. Returns a list of (text, bold)."""
+    text=" ".join(sentence(rng) for _ in range(max(1, runs//6)))
+    words=text.split(" ")
+    runs=min(runs, len(words))
+    cuts=sorted(rng.sample(range(1, len(words)), runs-1)) if runs>1 else []
+    pieces=[]
+    previous=0
+    for cut in cuts+[len(words)]:
+        pieces.append(" ".join(words[previous:cut])+(" " if cut<len(words) else ""))
+        previous=cut
+    return [(piece, rng.random()<0.1) for piece in pieces]
+
+
+DOCX_CONTENT_TYPES="""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>
+</Types>"""
+
+DOCX_RELS="""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>
+</Relationships>"""
+
+DOCX_DOCUMENT_RELS="""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships"></Relationships>"""
+
+
+def make_docx(path, paragraphs=100, runs=5, seed=1):
+    rng=random.Random(seed)
+    body=[]
+    for _ in range(paragraphs):
+        runs_xml=[]
+        for text, bold in fragments(rng, runs):
+            rsid="00%06X" % rng.randrange(16**6)
+            rpr="<w:rPr><w:b/></w:rPr>" if bold else "<w:rPr><w:lang w:val=\"en-US\"/></w:rPr>"
+            runs_xml.append(f'<w:r w:rsidRPr="{rsid}">{rpr}<w:t xml:space="preserve">{escape(text)}</w:t></w:r>')
+        body.append("<w:p>"+"".join(runs_xml)+"</w:p>")
+    document=('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+              '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>'
+              +"".join(body)+'<w:sectPr/></w:body></w:document>')
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as package:
+        package.writestr("[Content_Types].xml", DOCX_CONTENT_TYPES)
+        package.writestr("_rels/.rels", DOCX_RELS)
+        package.writestr("word/_rels/document.xml.rels", DOCX_DOCUMENT_RELS)
+        package.writestr("word/document.xml", document)
+
+
+ODT_NAMESPACES=('xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0" '
+                'xmlns:style="urn:oasis:names:tc:opendocument:xmlns:style:1.0" '
+                'xmlns:text="urn:oasis:names:tc:opendocument:xmlns:text:1.0" '
+                'xmlns:fo="urn:oasis:names:tc:opendocument:xmlns:xsl-fo-compatible:1.0" '
+                'xmlns:officeooo="http://openoffice.org/2009/office" office:version="1.3"')
+
+ODT_MANIFEST="""<?xml version="1.0" encoding="UTF-8"?>
+<manifest:manifest xmlns:manifest="urn:oasis:names:tc:opendocument:xmlns:manifest:1.0" manifest:version="1.3">
+<manifest:file-entry manifest:full-path="/" manifest:media-type="application/vnd.oasis.opendocument.text"/>
+<manifest:file-entry manifest:full-path="content.xml" manifest:media-type="text/xml"/>
+<manifest:file-entry manifest:full-path="styles.xml" manifest:media-type="text/xml"/>
+<manifest:file-entry manifest:full-path="meta.xml" manifest:media-type="text/xml"/>
+<manifest:file-entry manifest:full-path="settings.xml" manifest:media-type="text/xml"/>
+</manifest:manifest>"""
+
+ODT_STYLES=('<?xml version="1.0" encoding="UTF-8"?><office:document-styles '+ODT_NAMESPACES+'>'
+            '<office:styles><style:default-style style:family="paragraph">'
+            '<style:text-properties style:font-name="Liberation Serif" fo:font-size="12pt"/></style:default-style>'
+            '<style:style style:name="Standard" style:family="paragraph"/></office:styles></office:document-styles>')
+
+ODT_META=('<?xml version="1.0" encoding="UTF-8"?><office:document-meta '
+          'xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0" '
+          'xmlns:meta="urn:oasis:names:tc:opendocument:xmlns:meta:1.0" office:version="1.3">'
+          '<office:meta><meta:generator>MTUOC synthetic documents</meta:generator></office:meta></office:document-meta>')
+
+ODT_SETTINGS=('<?xml version="1.0" encoding="UTF-8"?><office:document-settings '
+              'xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0" office:version="1.3">'
+              '<office:settings/></office:document-settings>')
+
+
+def make_odt(path, paragraphs=100, runs=5, seed=1, rsid_styles=20):
+    rng=random.Random(seed)
+    # text styles that only differ in the revision ID, and one bold style
+    styles=[f'<style:style style:name="T{i}" style:family="text"><style:text-properties officeooo:rsid="{i:08x}"/></style:style>'
+            for i in range(1, rsid_styles+1)]
+    styles.append('<style:style style:name="TB" style:family="text"><style:text-properties fo:font-weight="bold"/></style:style>')
+    styles.append('<style:style style:name="P1" style:family="paragraph" style:parent-style-name="Standard"/>')
+    body=[]
+    for _ in range(paragraphs):
+        spans=[]
+        for text, bold in fragments(rng, runs):
+            style="TB" if bold else "T%d" % rng.randint(1, rsid_styles)
+            spans.append(f'<text:span text:style-name="{style}">{escape(text)}</text:span>')
+        body.append('<text:p text:style-name="P1">'+"".join(spans)+'</text:p>')
+    content=('<?xml version="1.0" encoding="UTF-8"?><office:document-content '+ODT_NAMESPACES+'>'
+             '<office:automatic-styles>'+"".join(styles)+'</office:automatic-styles>'
+             '<office:body><office:text>'+"".join(body)+'</office:text></office:body></office:document-content>')
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as package:
+        # the mimetype must be the first entry, and not compressed
+        package.writestr("mimetype", "application/vnd.oasis.opendocument.text", compress_type=zipfile.ZIP_STORED)
+        package.writestr("META-INF/manifest.xml", ODT_MANIFEST)
+        package.writestr("styles.xml", ODT_STYLES)
+        package.writestr("meta.xml", ODT_META)
+        package.writestr("settings.xml", ODT_SETTINGS)
+        package.writestr("content.xml", content)
+
+
+def make_pptx(path, paragraphs=100, runs=5, seed=1, paragraphs_per_slide=10):
+    from pptx import Presentation
+    from pptx.util import Inches
+
+    rng=random.Random(seed)
+    presentation=Presentation()
+    layout=presentation.slide_layouts[6]
+    slide=None
+    for index in range(paragraphs):
+        if index%paragraphs_per_slide==0:
+            slide=presentation.slides.add_slide(layout)
+            text_frame=slide.shapes.add_textbox(Inches(0.5), Inches(0.5), Inches(9), Inches(6)).text_frame
+            paragraph=text_frame.paragraphs[0]
+        else:
+            paragraph=text_frame.add_paragraph()
+        for text, bold in fragments(rng, runs):
+            run=paragraph.add_run()
+            run.text=text
+            if bold:
+                run.font.bold=True
+            # visually irrelevant differences, as left by editing and spell checking
+            rpr=run._r.get_or_add_rPr()
+            rpr.set("lang", rng.choice(["en-US", "en-GB"]))
+            rpr.set("dirty", "0")
+    presentation.save(path)
+
+
+GENERATORS={".docx": make_docx, ".odt": make_odt, ".pptx": make_pptx}
+
+
+def make_document(path, paragraphs=100, runs=5, seed=1):
+    extension=path[path.rfind("."):].lower()
+    GENERATORS[extension](path, paragraphs, runs, seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic DOCX, ODT or PPTX document.")
+    parser.add_argument("output", help="Output file (.docx, .odt or .pptx)")
+    parser.add_argument("--paragraphs", type=int, default=100, help="Number of paragraphs")
+    parser.add_argument("--runs", type=int, default=5, help="Runs/spans per paragraph")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed")
+    args = parser.parse_args()
+    make_document(args.output, args.paragraphs, args.runs, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import re
+
+"""
+    Protection of inline tags, URLs, e-mail addresses and numbers during MT.
+
+    MT engines often translate, split, duplicate or drop the inline tags of
+    a segment (<g id="1">bold</g>, <x id="2"/>...), and then the paragraph
+    cannot be merged back into the document. Before a segment is sent to
+    the engine, protect() replaces every tag, URL, e-mail address and number
+    by a compact placeholder (｟0｠, ｟1｠...), which engines copy much more
+    reliably, and restore() puts the original strings back into the
+    translation.
+
+    Placeholders that the engine duplicates are kept only once, and those it
+    drops are projected into the translation: they are inserted at the same
+    relative position they had in the source, moved to the nearest word
+    boundary, and URLs, e-mails and numbers are separated from the
+    neighbouring words with spaces. If the tags of the result are not
+    properly nested, all the tags are projected from the source, which keeps
+    their nesting.
+"""
+
+PLACEHOLDER="｟{}｠"
+PLACEHOLDER_RE=re.compile(r"｟(\d+)｠")
+
+PROTECTED=re.compile(
+    r"</?[A-Za-z]+(?: id=\"[^\"]*\")?\s*/?>"                    # inline tags
+    r"|(?:https?://|www\.)[^\s<>\"]*[^\s<>\".,;:!?)\]]"         # URLs
+    r"|[\w.+-]+@[\w-]+(?:\.[\w-]+)+"                           # e-mail addresses
+    r"|(?<![\w｟])\d+(?:[.,:/]\d+)*(?![\w｠])"                  # numbers
+)
+TAG=re.compile(r"<(/?)([A-Za-z]+)[^>]*?(/?)>")
+
+
+def protect(text):
+    """Returns the text with its tags, URLs, e-mails and numbers replaced by placeholders, and the list of replaced strings."""
+    originals=[]
+
+    def replace(match):
+        originals.append(match.group(0))
+        return PLACEHOLDER.format(len(originals)-1)
+
+    return PROTECTED.sub(replace, text), originals
+
+
+def tag_kind(original):
+    """Returns "open", "close" or "empty" for a tag, None for the other protected strings."""
+    match=TAG.fullmatch(original)
+    if match is None:
+        return None
+    if match.group(1):
+        return "close"
+    return "empty" if match.group(3) else "open"
+
+
+def well_nested(pieces, originals):
+    depth=0
+    for piece in pieces:
+        if isinstance(piece, int):
+            kind=tag_kind(originals[piece])
+            if kind=="open":
+                depth+=1
+            elif kind=="close":
+                depth-=1
+                if depth<0:
+                    return False
+    return depth==0
+
+
+def project(pieces, index, position, originals):
+    """Inserts placeholder index in pieces at the relative position (0 to 1) of the text, at a word boundary."""
+    text_length=sum(len(piece) for piece in pieces if isinstance(piece, str))
+    target=round(position*text_length)
+    closing=tag_kind(originals[index])=="close"
+    offset=0
+    # placeholders already at the same position stay before the new one, so
+    # that tags projected in source order keep their order
+    for i, piece in enumerate(pieces):
+        if isinstance(piece, int):
+            if offset>target:
+                pieces.insert(i, index)
+                return
+            continue
+        if offset+len(piece)>target:
+            cut=target-offset
+            # closing tags go after the word they end, the others before the word they start
+            boundaries=[j for j in range(len(piece)+1) if j in (0, len(piece)) or piece[j-1].isspace()!=piece[j].isspace()]
+            if closing:
+                boundaries=[j for j in boundaries if j==0 or not piece[j-1].isspace()]
+            else:
+                boundaries=[j for j in boundaries if j==len(piece) or not piece[j].isspace()]
+            cut=min(boundaries, key=lambda j: abs(j-cut)) if boundaries else cut
+            pieces[i:i+1]=[piece[:cut], index, piece[cut:]]
+            return
+        offset+=len(piece)
+    pieces.append(index)
+
+
+def joins_word(piece, originals, at_start):
+    """True if piece would join a projected URL, e-mail or number that is written next to it into a single word."""
+    if isinstance(piece, int):
+        return tag_kind(originals[piece]) is None
+    return not (piece[0] if at_start else piece[-1]).isspace()
+
+
+def separate(pieces, projected, originals):
+    """Separates the projected URLs, e-mails and numbers from the neighbouring words with spaces."""
+    separated=[]
+    for i, piece in enumerate(pieces):
+        if isinstance(piece, int) and piece in projected:
+            before=next((p for p in reversed(separated) if p!=""), None)
+            if before is not None and joins_word(before, originals, False):
+                separated.append(" ")
+            separated.append(piece)
+            after=next((p for p in pieces[i+1:] if p!=""), None)
+            if after is not None and joins_word(after, originals, True):
+                separated.append(" ")
+        else:
+            separated.append(piece)
+    return separated
+
+
+def restore(translation, protected, originals):
+    """Replaces the placeholders of a translation by the original strings, projecting those the engine lost."""
+    if not originals:
+        return translation
+    pieces=[]
+    seen=set()
+    last=0
+    for match in PLACEHOLDER_RE.finditer(translation):
+        pieces.append(translation[last:match.start()])
+        index=int(match.group(1))
+        # unknown and repeated placeholders are dropped
+        if index<len(originals) and index not in seen:
+            pieces.append(index)
+            seen.add(index)
+        last=match.end()
+    pieces.append(translation[last:])
+
+    positions={}
+    source_text_length=len(PLACEHOLDER_RE.sub("", protected)) or 1
+    offset=0
+    last=0
+    for match in PLACEHOLDER_RE.finditer(protected):
+        offset+=match.start()-last
+        positions[int(match.group(1))]=offset/source_text_length
+        last=match.end()
+
+    projected=set()
+    for index in range(len(originals)):
+        if index not in seen:
+            project(pieces, index, positions[index], originals)
+            if tag_kind(originals[index]) is None:
+                projected.add(index)
+
+    if not well_nested(pieces, originals):
+        pieces=[piece for piece in pieces if isinstance(piece, str) or tag_kind(originals[piece]) is None]
+        for index in range(len(originals)):
+            if tag_kind(originals[index]) is not None:
+                project(pieces, index, positions[index], originals)
+    # a projected URL, e-mail or number must not be glued to a word, unlike a tag
+    pieces=separate(pieces, projected, originals)
+
+    return "".join(piece if isinstance(piece, str) else originals[piece] for piece in pieces)
@@ -1,13 +1,5 @@
 import os
 import subprocess
-import argparse
-import codecs
-import sys
-import random
-import requests
-import re
-from collections import Counter
-import xml.etree.ElementTree as ET
 
 
 class Tikal():
@@ -18,6 +10,7 @@ class Tikal():
         self.segment=False
         self.srx_file=None
         self.okf=None
+        self.java_opts=None
         
         self.ip="127.0.0.1"
         self.port=8000
@@ -39,6 +32,10 @@ class Tikal():
     
     def set_okf(self, okf_filter):
         self.okf=okf_filter
+
+    def set_java_opts(self, java_opts):
+        # passed to the JVM by tikalMTUOC.sh, e.g. "-Xmx1024m" to bound its memory
+        self.java_opts=java_opts
         
     def set_ip(self, ip):
         self.ip=ip
@@ -51,26 +48,54 @@ class Tikal():
         
         
            
-    def translate(self, input_file):
-        try:
-            command = [self.tikal_path, '-t', input_file, '-sl', self.sl, '-tl',  self.tl]
-            if self.segment:
-                extension=['-seg',self.srx_file]
-                command.extend(extension)
-                
-            if not self.okf==None:
-                extension=['-fc',self.okf]
-                command.extend(extension)
-            self.transURL="http://"+str(self.ip)+":"+str(self.port)
-            extension=['-mtuoc',self.transURL]
+    def base_command(self, option, input_file):
+        command = [self.tikal_path, option, input_file, '-sl', self.sl, '-tl',  self.tl]
+        if self.segment:
+            extension=['-seg',self.srx_file]
             command.extend(extension)
-            # Run the command
-            subprocess.run(command, check=True)
-            #output_file=input_file+".xlf"
-            #print(f"Successfully converted {input_file} to {output_file}")
             
+        if not self.okf==None:
+            extension=['-fc',self.okf]
+            command.extend(extension)
+        return command
+
+    def run(self, command):
+        try:
+            # Run the command
+            env=None
+            if self.java_opts is not None:
+                env=dict(os.environ, TIKAL_JAVA_OPTS=self.java_opts)
+            subprocess.run(command, check=True, env=env)
+            return True
         except subprocess.CalledProcessError as e:
             print(f"Error during conversion: {e}")
         except FileNotFoundError:
             print("Error: Tikal executable not found. Please check the Tikal path.")
- 
+        return False
+
+    def output_path(self, input_file):
+        """Path of the file that Tikal writes when translating or merging input_file."""
+        name, extension = os.path.splitext(input_file)
+        return name+".out"+extension
+           
+    def translate(self, input_file):
+        command = self.base_command('-t', input_file)
+        self.transURL="http://"+str(self.ip)+":"+str(self.port)
+        extension=['-mtuoc',self.transURL]
+        command.extend(extension)
+        self.run(command)
+        #output_file=input_file+".xlf"
+        #print(f"Successfully converted {input_file} to {output_file}")
+
+    def extract(self, input_file):
+        """Extracts the segments of input_file into an XLIFF file. Returns its path, or None on error."""
+        if self.run(self.base_command('-x', input_file)):
+            return input_file+".xlf"
+        return None
+
+    def merge(self, xlf_file):
+        """Merges a translated XLIFF file with its original document. Returns the translated document path, or None on error."""
+        original_file = xlf_file[:-len(".xlf")]
+        if self.run(self.base_command('-m', xlf_file)):
+            return self.output_path(original_file)
+        return None
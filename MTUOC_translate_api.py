@@ -0,0 +1,266 @@
+import os
+import sys
+import json
+import shutil
+import argparse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, quote
+
+from MTUOC_engines import load_engines
+from MTUOC_jobs import JobRegistry
+from MTUOC_file_translator import translate_file
+from MTUOC_metrics import metrics
+from MTUOC_package import memory_budget
+from MTUOC_document_cache import DocumentCache
+from MTUOC_scheduler import scheduling, INTERACTIVE
+from MTUOC_admission import QueueFull, document_queue
+from MTUOC_store import open_store
+from TextBox_translator import MTServerError
+
+"""
+    A headless HTTP API for the MTUOC web translator.
+
+    It offers the same functionality as the Streamlit interface, without
+    the cost of rerunning a script for every interaction:
+
+        GET  /engines                  list of configured engines
+        POST /translate                {"engine": name, "segments": [...]} or
+                                       {"engine": name, "text": "..."}
+        POST /jobs?engine=E&filename=F upload a file (raw body) to translate
+        GET  /jobs/<id>                state of a file job
+        GET  /jobs/<id>/download       translated file
+        GET  /metrics                  timings in Prometheus text format
+
+    HTTP requests are handled in threads, and file jobs are queued to a
+    bounded pool of workers, so submitting a file returns immediately.
+    Uploads larger than --max-upload MB are rejected with 413, and the file
+    jobs share a memory budget (--memory-budget, see MTUOC_package). When
+    --max-queue jobs are queued, or the MT server has too many requests
+    waiting, requests are rejected with 503 and a Retry-After header; the
+    state of a queued job includes its position in the queue. With --store
+    (see MTUOC_store), the job states, the document cache index and the
+    translated segments are shared by all the API and web processes that use
+    the same store, so several processes can run behind a proxy.
+"""
+
+CHUNK_SIZE=1024*1024
+
+
+class TranslateAPIHandler(BaseHTTPRequestHandler):
+    # These are set by make_server
+    engines={}
+    jobs=None
+    batch_size=32
+    max_upload_mb=None
+    document_cache=None
+    store=None
+
+    def send_json(self, status, data):
+        body=json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        if status==503:
+            self.send_header("Retry-After", "30")
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def user(self):
+        """Identifies the user for the fair sharing of the MT servers: the X-User header or the client address."""
+        return self.headers.get("X-User") or self.client_address[0]
+
+    def content_length(self):
+        """The length of the request body, None if the Content-Length header is not valid."""
+        try:
+            length=int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            return None
+        return length if length>=0 else None
+
+    def read_json(self):
+        """Reads the JSON body of the request. Raises ValueError if it is not valid or not complete."""
+        length=self.content_length()
+        if length is None:
+            raise ValueError("Invalid Content-Length")
+        body=self.rfile.read(length)
+        if len(body)<length:
+            raise ValueError("Incomplete body")
+        return json.loads(body or b"{}")
+
+    def do_GET(self):
+        parts=[part for part in urlparse(self.path).path.split("/") if part]
+        if parts==["engines"]:
+            self.send_json(200, [{"name": engine.name, "server_type": engine.server_type,
+                                  "source": engine.source_suffix, "target": engine.target_suffix}
+                                 for engine in self.engines.values()])
+        elif len(parts)==2 and parts[0]=="jobs":
+            job=self.jobs.get(parts[1])
+            if job is None:
+                self.send_json(404, {"error": "Unknown job"})
+            else:
+                state={key: job[key] for key in ("id", "engine", "filename", "status", "error", "created", "finished")}
+                if job["status"]=="queued":
+                    state["position"]=self.jobs.position(job["id"])
+                self.send_json(200, state)
+        elif len(parts)==3 and parts[0]=="jobs" and parts[2]=="download":
+            self.send_download(parts[1])
+        elif parts==["metrics"]:
+            body=metrics.prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        url=urlparse(self.path)
+        parts=[part for part in url.path.split("/") if part]
+        if parts==["translate"]:
+            self.translate_text()
+        elif parts==["jobs"]:
+            self.submit_job(parse_qs(url.query))
+        else:
+            self.send_json(404, {"error": "Not found"})
+
+    def translate_text(self):
+        try:
+            request=self.read_json()
+        except ValueError:
+            self.send_json(400, {"error": "Invalid JSON"})
+            return
+        if not isinstance(request, dict):
+            self.send_json(400, {"error": "The body must be a JSON object"})
+            return
+        engine=self.engines.get(request.get("engine")) if isinstance(request.get("engine"), str) else None
+        if engine is None:
+            self.send_json(400, {"error": "Unknown engine"})
+            return
+        single="segments" not in request
+        segments=[request.get("text", "")] if single else request["segments"]
+        if not isinstance(segments, list) or not all(isinstance(segment, str) for segment in segments):
+            self.send_json(400, {"error": "text must be a string and segments a list of strings"})
+            return
+        try:
+            translations=[]
+            with scheduling(INTERACTIVE, self.user()):
+                for start in range(0, len(segments), self.batch_size):
+                    translations.extend(engine.translate_batch(segments[start:start+self.batch_size]))
+        except MTServerError as e:
+            self.send_json(502, {"error": str(e)})
+            return
+        except QueueFull as e:
+            self.send_json(503, {"error": str(e)})
+            return
+        if single:
+            self.send_json(200, {"translation": translations[0]})
+        else:
+            self.send_json(200, {"translations": translations})
+
+    def submit_job(self, query):
+        engine=self.engines.get(query.get("engine", [None])[0])
+        filename=os.path.basename(query.get("filename", [""])[0])
+        if engine is None or filename in ("", ".", ".."):
+            self.send_json(400, {"error": "engine and filename are required"})
+            return
+        remaining=self.content_length()
+        if remaining is None:
+            self.send_json(400, {"error": "Invalid Content-Length"})
+            self.close_connection=True
+            return
+        if self.max_upload_mb is not None and remaining>self.max_upload_mb*1024*1024:
+            self.send_json(413, {"error": f"The file is larger than {self.max_upload_mb} MB"})
+            self.close_connection=True
+            return
+        try:
+            job=self.jobs.create(filename, engine.name, self.user())
+        except QueueFull as e:
+            self.send_json(503, {"error": str(e)})
+            self.close_connection=True
+            return
+        # The upload is written to disk in chunks, so that big files are not kept in memory
+        with open(job["input_path"], "wb") as f:
+            while remaining>0:
+                chunk=self.rfile.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                f.write(chunk)
+                remaining-=len(chunk)
+        if remaining>0:
+            # the client closed the connection before sending the whole file
+            self.jobs.remove(job["id"])
+            self.send_json(400, {"error": "Incomplete upload"})
+            self.close_connection=True
+            return
+        self.jobs.submit(job["id"], translate_file, engine, None, "checkpoints", self.batch_size, self.document_cache, None, self.store)
+        self.send_json(202, {"id": job["id"], "status": job["status"]})
+
+    def send_download(self, job_id):
+        job=self.jobs.get(job_id)
+        if job is None:
+            self.send_json(404, {"error": "Unknown job"})
+            return
+        if job["status"]!="done":
+            self.send_json(409, {"error": "Job is "+job["status"]})
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(os.path.getsize(job["output_path"])))
+        self.send_header("Content-Disposition", content_disposition(os.path.basename(job["output_path"])))
+        self.end_headers()
+        with open(job["output_path"], "rb") as f:
+            shutil.copyfileobj(f, self.wfile, CHUNK_SIZE)
+
+
+def content_disposition(filename):
+    """Content-Disposition header of a download (RFC 6266), with an ASCII fallback for old clients."""
+    fallback="".join(c if " "<=c<="~" and c not in '"\\' else "_" for c in filename)
+    return f'attachment; filename="{fallback}"; filename*=UTF-8\'\'{quote(filename, safe="")}'
+
+
+def make_server(host="127.0.0.1", port=8080, config="mtSystems.yaml", jobs_dir="jobs", workers=2, batch_size=32,
+                max_upload_mb=None, memory_budget_mb=None, document_cache_dir="document_cache", max_queued_jobs=None, store_url=None, job_hours=24):
+    store=open_store(store_url)
+    TranslateAPIHandler.engines=load_engines(config)
+    TranslateAPIHandler.jobs=JobRegistry(jobs_dir, workers, max_queued_jobs, store, job_hours*3600)
+    TranslateAPIHandler.store=store
+    # the jobs wait in the registry, so every worker can process a document
+    document_queue.set_limits(workers=workers)
+    TranslateAPIHandler.batch_size=batch_size
+    TranslateAPIHandler.max_upload_mb=max_upload_mb
+    TranslateAPIHandler.document_cache=DocumentCache(document_cache_dir, store=store) if document_cache_dir else None
+    if memory_budget_mb is not None:
+        memory_budget.set_total(memory_budget_mb)
+    return ThreadingHTTPServer((host, port), TranslateAPIHandler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP API for the MTUOC web translator.")
+    parser.add_argument("--host", default="127.0.0.1", help="Host to listen on")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on")
+    parser.add_argument("--config", default="mtSystems.yaml", help="MT systems configuration file")
+    parser.add_argument("--jobs-dir", default="jobs", help="Directory for uploaded and translated files")
+    parser.add_argument("--workers", type=int, default=2, help="Number of file translation workers")
+    parser.add_argument("--batch-size", type=int, default=32, help="Segments per request to the MT server")
+    parser.add_argument("--max-upload", type=int, default=None, help="Maximum size of an uploaded file, in MB")
+    parser.add_argument("--memory-budget", type=int, default=None, help="MB of memory shared by the file jobs running at the same time")
+    parser.add_argument("--document-cache", default="document_cache", help="Directory of translated documents (use '' to disable)")
+    parser.add_argument("--max-queue", type=int, default=None, help="Maximum number of queued file jobs; more are rejected with 503")
+    parser.add_argument("--store", default=os.environ.get("MTUOC_STORE"), help="Store shared with other processes, e.g. sqlite:///path/store.db (see MTUOC_store.py)")
+    parser.add_argument("--job-hours", type=float, default=24, help="Hours after which finished jobs and their files are removed")
+    args = parser.parse_args()
+
+    server=make_server(args.host, args.port, args.config, args.jobs_dir, args.workers, args.batch_size,
+                       args.max_upload, args.memory_budget, args.document_cache, args.max_queue, args.store, args.job_hours)
+    print(f"MTUOC translate API listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import os
+import json
+import threading
+
+
+class TranslationCache():
+    """
+    A cache of segment translations, keyed by engine name and source segment.
+
+    The cache is kept in memory and, if a path is given, appended to a JSON
+    lines file, so that it survives between runs. With a store (see
+    MTUOC_store), the translations are kept in the given namespace of the
+    store instead, shared with the other processes that use it, and the
+    memory only keeps those already read. Only the segments that are not in
+    the cache are sent to the MT engine.
+    """
+
+    def __init__(self, path=None, store=None, namespace="translations"):
+        self.path=path if store is None else None
+        self.store=store
+        self.namespace=namespace
+        self.entries={}
+        self.hits=0
+        self.misses=0
+        self.lock=threading.Lock()
+        if self.path is not None and os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry=json.loads(line)
+                    except ValueError:
+                        # a run that was killed may have left a partial last line
+                        continue
+                    self.entries[(entry["engine"], entry["src"])]=entry["tgt"]
+        self.file=open(self.path, "a", encoding="utf-8") if self.path is not None else None
+
+    @staticmethod
+    def store_key(engine_name, segment):
+        return engine_name+"\n"+segment
+
+    def get(self, engine_name, segment):
+        return self.get_many(engine_name, [segment])[0]
+
+    def get_many(self, engine_name, segments):
+        """Returns the cached translations of segments, None for those not in the cache."""
+        with self.lock:
+            translations=[self.entries.get((engine_name, segment)) for segment in segments]
+        if self.store is not None:
+            # the segments that are not in memory may have been translated by another process
+            missing=[self.store_key(engine_name, segment) for segment, translation in zip(segments, translations) if translation is None]
+            if missing:
+                found=self.store.get_many(self.namespace, missing)
+                with self.lock:
+                    for i, segment in enumerate(segments):
+                        if translations[i] is None and self.store_key(engine_name, segment) in found:
+                            translations[i]=found[self.store_key(engine_name, segment)]
+                            self.entries[(engine_name, segment)]=translations[i]
+        with self.lock:
+            misses=translations.count(None)
+            self.misses+=misses
+            self.hits+=len(translations)-misses
+        return translations
+
+    def put(self, engine_name, segment, translation):
+        self.put_many(engine_name, {segment: translation})
+
+    def put_many(self, engine_name, translations):
+        """Adds translations (source -> target) to the cache."""
+        if self.store is not None:
+            self.store.put_many(self.namespace, {self.store_key(engine_name, segment): translation for segment, translation in translations.items()})
+        with self.lock:
+            for segment, translation in translations.items():
+                self.put_entry(engine_name, segment, translation)
+
+    def put_entry(self, engine_name, segment, translation):
+        self.entries[(engine_name, segment)]=translation
+        if self.file is not None:
+            self.file.write(json.dumps({"engine": engine_name, "src": segment, "tgt": translation}, ensure_ascii=False)+"\n")
+            self.file.flush()
+
+    def preload(self, engine_name, translations):
+        """Adds translations (source -> target) to the cache in memory only, without writing them to the file."""
+        with self.lock:
+            for segment, translation in translations.items():
+                self.entries.setdefault((engine_name, segment), translation)
+
+    def translate_batch(self, engine, segments):
+        """Translates a list of segments with engine, sending only the cache misses."""
+        translations=self.get_many(engine.name, segments)
+        missing=[i for i, translation in enumerate(translations) if translation is None]
+        # identical segments in the same batch are translated only once
+        unique=list(dict.fromkeys(segments[i] for i in missing))
+        if unique:
+            translated=dict(zip(unique, engine.translate_batch(unique)))
+            self.put_many(engine.name, translated)
+            for i in missing:
+                translations[i]=translated[segments[i]]
+        return translations
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file=None
+
+    def __len__(self):
+        if self.store is not None:
+            return self.store.count(self.namespace)
+        return len(self.entries)
@@ -0,0 +1,163 @@
+import os
+import re
+import json
+import difflib
+import threading
+from collections import Counter
+
+"""
+    A fuzzy-match translation memory.
+
+    Exact caches (TranslationCache) miss the segments that only differ from a
+    translated one in a number, a date or a small edit, which are frequent in
+    revised documents. The translation memory stores the segments translated
+    by an engine with their numbers replaced by placeholders, so a segment
+    that only differs in its numbers is an exact match, and the numbers of
+    the new segment are put into the stored translation. Other segments are
+    looked up in an inverted index of character trigrams: the candidates
+    sharing the most trigrams are scored with the Dice coefficient and
+    verified with difflib, and the best one is used if its similarity is
+    at least the threshold of the memory. Fuzzy matches are only used when
+    they have the same inline tags as the segment.
+"""
+
+NUMBER_OR_TAG=re.compile(r"(<[^>]+>)|(\d+(?:[.,:/]\d+)*)")
+TAG=re.compile(r"<[^>]+>")
+PLACEHOLDER=re.compile(r"\{(\d+)\}")
+
+
+def normalize(segment):
+    """Returns the segment with its numbers (not those inside tags) replaced by {0}, {1}... and the list of numbers."""
+    numbers=[]
+
+    def replace(match):
+        if match.group(1):
+            return match.group(1)
+        numbers.append(match.group(2))
+        return "{"+str(len(numbers)-1)+"}"
+
+    # braces of the text itself must not be taken for placeholders
+    escaped=segment.replace("{", "{{").replace("}", "}}")
+    return NUMBER_OR_TAG.sub(replace, escaped), numbers
+
+
+def trigrams(text):
+    text=" "+text.lower()+" "
+    return set(text[i:i+3] for i in range(len(text)-2))
+
+
+class TranslationMemory():
+    def __init__(self, path=None, threshold=0.9):
+        self.path=path
+        self.threshold=threshold
+        # engine name -> list of (template, number count, target template, trigram count)
+        self.entries={}
+        # engine name -> template -> entry id
+        self.exact={}
+        # engine name -> trigram -> entry ids
+        self.index={}
+        self.exact_hits=0
+        self.fuzzy_hits=0
+        self.misses=0
+        self.lock=threading.Lock()
+        if self.path is not None and os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry=json.loads(line)
+                    except ValueError:
+                        continue
+                    self._add(entry["engine"], entry["src"], entry["tgt"])
+        self.file=open(self.path, "a", encoding="utf-8") if self.path is not None else None
+
+    def _add(self, engine_name, source, translation):
+        template, numbers=normalize(source)
+        target, target_numbers=normalize(translation)
+        if sorted(numbers)!=sorted(target_numbers):
+            # the numbers are not simply copied to the translation: the entry is only
+            # valid for the same numbers
+            template, numbers=source.replace("{", "{{").replace("}", "}}"), []
+            target=translation.replace("{", "{{").replace("}", "}}")
+        else:
+            # the placeholders of the target refer to the positions of the numbers in the source
+            positions={}
+            for position, number in enumerate(numbers):
+                positions.setdefault(number, []).append(position)
+            target=PLACEHOLDER.sub(lambda match: "{"+str(positions[target_numbers[int(match.group(1))]].pop(0))+"}", target)
+        exact=self.exact.setdefault(engine_name, {})
+        if template in exact:
+            return
+        entries=self.entries.setdefault(engine_name, [])
+        grams=trigrams(template)
+        exact[template]=len(entries)
+        index=self.index.setdefault(engine_name, {})
+        for gram in grams:
+            index.setdefault(gram, []).append(len(entries))
+        entries.append((template, len(numbers), target, len(grams)))
+
+    def add(self, engine_name, source, translation):
+        with self.lock:
+            self._add(engine_name, source, translation)
+            if self.file is not None:
+                self.file.write(json.dumps({"engine": engine_name, "src": source, "tgt": translation}, ensure_ascii=False)+"\n")
+                self.file.flush()
+
+    def fill(self, target, numbers):
+        return target.format(*numbers)
+
+    def lookup(self, engine_name, segment):
+        """Returns the translation of segment from the memory, or None if there is no match above the threshold."""
+        template, numbers=normalize(segment)
+        with self.lock:
+            entries=self.entries.get(engine_name, [])
+            entry_id=self.exact.get(engine_name, {}).get(template)
+            if entry_id is None and numbers:
+                # entries whose numbers could not be replaced by placeholders
+                entry_id=self.exact.get(engine_name, {}).get(segment.replace("{", "{{").replace("}", "}}"))
+                if entry_id is not None:
+                    numbers=[]
+            if entry_id is not None:
+                self.exact_hits+=1
+                return self.fill(entries[entry_id][2], numbers)
+
+            match=self.fuzzy_match(engine_name, template, len(numbers))
+            if match is None:
+                self.misses+=1
+                return None
+            self.fuzzy_hits+=1
+            return self.fill(entries[match][2], numbers)
+
+    def fuzzy_match(self, engine_name, template, number_count):
+        entries=self.entries.get(engine_name, [])
+        index=self.index.get(engine_name, {})
+        grams=trigrams(template)
+        if not grams or not entries:
+            return None
+        shared=Counter()
+        for gram in grams:
+            shared.update(index.get(gram, ()))
+        tags=TAG.findall(template)
+        best=None
+        best_score=self.threshold
+        for entry_id, common in shared.most_common():
+            candidate, candidate_numbers, target, candidate_grams=entries[entry_id]
+            # Dice coefficient of the trigram sets; the counter is ordered by shared trigrams,
+            # so no later candidate can score above the best possible value of this one
+            if 2*common/(len(grams)+common)<best_score:
+                break
+            score=2*common/(len(grams)+candidate_grams)
+            if score<best_score or candidate_numbers!=number_count or TAG.findall(candidate)!=tags:
+                continue
+            if difflib.SequenceMatcher(None, template, candidate).ratio()<self.threshold:
+                continue
+            best=entry_id
+            best_score=score
+        return best
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file=None
+
+    def __len__(self):
+        return sum(len(entries) for entries in self.entries.values())
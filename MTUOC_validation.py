@@ -0,0 +1,147 @@
+import os
+import zlib
+import zipfile
+from urllib.parse import unquote
+from xml.parsers import expat
+
+from MTUOC_package import CHUNK_SIZE, XML_EXTENSIONS
+
+"""
+    Structural validation of translated office documents.
+
+    A document merged by Tikal is valid if it is a sound zip package (its
+    XML parts decompress and match their CRC), it has the parts that its
+    format requires, every XML part is well-formed (so its tags are balanced),
+    the relationships of DOCX and PPTX point to existing parts, and it has
+    the same number of paragraphs per part as the source document, that is,
+    no segment was lost or duplicated in the merge. The problems that the
+    source document already has are not reported.
+
+    The XML parts are streamed through expat in chunks, so the validation
+    needs little memory and no object tree, and it is cheap enough to run on
+    every merged document (see translate_with_tikal). The source is scanned
+    once per DocumentValidator, however many merges are validated against
+    it.
+"""
+
+REQUIRED_PARTS={
+    ".docx": ["[Content_Types].xml", "word/document.xml"],
+    ".pptx": ["[Content_Types].xml", "ppt/presentation.xml"],
+    ".xlsx": ["[Content_Types].xml", "xl/workbook.xml"],
+    ".odt": ["mimetype", "content.xml"],
+    ".odf": ["mimetype", "content.xml"],
+    ".odp": ["mimetype", "content.xml"],
+    ".ods": ["mimetype", "content.xml"],
+}
+
+# Paragraph elements, as "namespace localname"
+PARAGRAPH_TAGS={
+    "http://schemas.openxmlformats.org/wordprocessingml/2006/main p",
+    "http://schemas.openxmlformats.org/drawingml/2006/main p",
+    "urn:oasis:names:tc:opendocument:xmlns:text:1.0 p",
+    "urn:oasis:names:tc:opendocument:xmlns:text:1.0 h",
+}
+
+RELATIONSHIP_TAG="http://schemas.openxmlformats.org/package/2006/relationships Relationship"
+
+
+def relationship_target(rels_name, target):
+    """Returns the name of the part that a relationship in the part rels_name points to."""
+    target=unquote(target)
+    if target.startswith("/"):
+        return target[1:]
+    # word/_rels/document.xml.rels -> word/
+    base=os.path.dirname(os.path.dirname(rels_name))
+    return os.path.normpath(os.path.join(base, target)).replace(os.sep, "/")
+
+
+def scan_part(package, name):
+    """
+    Parses an XML part of a zip package incrementally. Returns the number of
+    paragraphs and the relationship targets (for .rels parts). Raises
+    expat.ExpatError if it is not well-formed, or zipfile.BadZipFile or
+    zlib.error if it is damaged.
+    """
+    paragraphs=0
+    targets=[]
+    parser=expat.ParserCreate(namespace_separator=" ")
+
+    def start_element(tag, attributes):
+        nonlocal paragraphs
+        if tag in PARAGRAPH_TAGS:
+            paragraphs+=1
+        elif tag==RELATIONSHIP_TAG and attributes.get("TargetMode")!="External" and "Target" in attributes:
+            targets.append(attributes["Target"])
+
+    parser.StartElementHandler=start_element
+    with package.open(name) as part:
+        # reading a member to the end checks its CRC
+        while True:
+            chunk=part.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            parser.Parse(chunk, False)
+    parser.Parse(b"", True)
+    return paragraphs, targets
+
+
+class DocumentValidator():
+    def __init__(self, source=None):
+        self.source=source
+        self.source_problems=None
+        self.source_paragraphs=None
+
+    def scan(self, path):
+        """Returns the list of problems of a package and its number of paragraphs per XML part."""
+        problems=[]
+        paragraphs={}
+        try:
+            with zipfile.ZipFile(path) as package:
+                names=set(package.namelist())
+                extension=os.path.splitext(path)[1].lower()
+                for required in REQUIRED_PARTS.get(extension, []):
+                    if required not in names:
+                        problems.append(f"missing part {required}")
+                for name in sorted(names):
+                    if not name.lower().endswith(XML_EXTENSIONS):
+                        continue
+                    try:
+                        paragraphs[name], targets=scan_part(package, name)
+                    except expat.ExpatError as e:
+                        problems.append(f"{name} is not well-formed: {e}")
+                        continue
+                    for target in targets:
+                        if relationship_target(name, target) not in names:
+                            problems.append(f"{name} points to missing part {target}")
+        # zlib.error: corrupt deflate stream, NotImplementedError/RuntimeError: unsupported compression or encryption
+        except (zipfile.BadZipFile, zipfile.LargeZipFile, zlib.error, OSError, EOFError, RuntimeError, NotImplementedError) as e:
+            problems.append(f"damaged package: {e}")
+        return problems, paragraphs
+
+    def problems(self, path):
+        """Returns the list of problems of a translated document, empty if it is valid."""
+        if path is None or not os.path.exists(path):
+            return ["file not found"]
+        if os.path.splitext(path)[1].lower() not in REQUIRED_PARTS:
+            # other formats are not packages
+            return []
+        problems, paragraphs=self.scan(path)
+        if self.source is not None:
+            if self.source_paragraphs is None:
+                self.source_problems, self.source_paragraphs=self.scan(self.source)
+            problems=[problem for problem in problems if problem not in self.source_problems]
+            for name, count in self.source_paragraphs.items():
+                if name in paragraphs and paragraphs[name]!=count:
+                    problems.append(f"{name} has {paragraphs[name]} paragraphs instead of {count}")
+        return problems
+
+    def is_valid(self, path):
+        problems=self.problems(path)
+        for problem in problems:
+            print(f"Invalid document {path}: {problem}")
+        return not problems
+
+
+def is_valid_document(path, source=None):
+    """Checks that a translated document is structurally sound, and has the paragraphs of source if it is given."""
+    return DocumentValidator(source).is_valid(path)
@@ -0,0 +1,212 @@
+import re
+import copy
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape, unescape
+
+"""
+    Reading and writing of the XLIFF 1.2 files extracted by Tikal.
+
+    Tikal extracts every paragraph of a document as a trans-unit. When a
+    segmentation file is used, the paragraph is split in segments, which
+    appear as <mrk mtype="seg"> elements in <seg-source> and <target>.
+    XliffDocument gives access to these segments, so that they can be
+    translated from Python and the file merged back with Tikal.
+
+    The content of a segment is exchanged as a string, in which the inline
+    codes are written as compact tags with their id only: <g id="1">bold</g>,
+    <x id="2"/>, <ph id="3"/> etc. When a translation is written back, the
+    tags are matched by name and id with the inline codes of the source, and
+    the original elements (with all their attributes and native code
+    content) are restored. The text between the tags is escaped as in XML
+    (&amp;, &lt;, &gt;); unescape_text and escape_text convert it to plain
+    text for the MT engines and back.
+"""
+
+XLIFF_NS="urn:oasis:names:tc:xliff:document:1.2"
+XML_LANG="{http://www.w3.org/XML/1998/namespace}lang"
+
+# Inline elements whose content is text to translate, the rest are opaque codes
+CONTAINER_CODES=["g", "mrk"]
+
+# The compact tags written by inline_to_string
+INLINE_TAG=re.compile(r'(</?[A-Za-z]+(?: id="[^"]*")?\s*/?>)')
+
+
+def qname(name):
+    return "{"+XLIFF_NS+"}"+name
+
+
+def local_name(tag):
+    return tag.split("}", 1)[-1]
+
+
+def inline_to_string(element):
+    """Serializes the text and inline codes of element as a string."""
+    parts=[escape(element.text or "")]
+    for child in element:
+        name=local_name(child.tag)
+        code_id=child.get("id", child.get("mid", ""))
+        if name in CONTAINER_CODES:
+            parts.append('<'+name+' id="'+escape(code_id, {'"': "&quot;"})+'">'+inline_to_string(child)+'</'+name+'>')
+        else:
+            parts.append('<'+name+' id="'+escape(code_id, {'"': "&quot;"})+'"/>')
+        parts.append(escape(child.tail or ""))
+    return "".join(parts)
+
+
+def unescape_text(text):
+    """Unescapes the text of a segment string, keeping its inline tags: "a &amp; <x id="1"/>" -> "a & <x id="1"/>"."""
+    pieces=INLINE_TAG.split(text)
+    # the odd pieces are the tags
+    return "".join(piece if i%2 else unescape(piece) for i, piece in enumerate(pieces))
+
+
+def escape_text(text):
+    """Escapes the text of a segment string outside its inline tags, the reverse of unescape_text."""
+    pieces=INLINE_TAG.split(text)
+    return "".join(piece if i%2 else escape(piece) for i, piece in enumerate(pieces))
+
+
+def code_key(code):
+    return (local_name(code.tag), code.get("id", code.get("mid", "")))
+
+
+def inline_codes(element):
+    """Returns a dictionary (name, id) -> element of all the inline codes in element."""
+    codes={}
+    for child in element.iter():
+        if child is element:
+            continue
+        codes[code_key(child)]=child
+    return codes
+
+
+def strip_tags(text):
+    """Removes the inline tags of a segment string, leaving plain text."""
+    return re.sub(r"<[^>]*>", "", text).replace("&lt;", "<").replace("&gt;", ">").replace("&amp;", "&")
+
+
+def _rebuild(fragment, codes, target):
+    target.text=fragment.text
+    for child in fragment:
+        name=child.tag
+        original=codes.get((name, child.get("id", "")))
+        if original is None:
+            raise ValueError("Unknown inline code "+name+" "+child.get("id", ""))
+        new=ET.SubElement(target, original.tag, dict(original.attrib))
+        if name in CONTAINER_CODES:
+            _rebuild(child, codes, new)
+        else:
+            # opaque codes keep their original content (native code)
+            new.text=original.text
+            for grandchild in original:
+                new.append(copy.deepcopy(grandchild))
+        new.tail=child.tail
+
+
+def clear_content(element):
+    """Removes the text and children of element, keeping its attributes and tail."""
+    attrib=dict(element.attrib)
+    tail=element.tail
+    element.clear()
+    element.attrib.update(attrib)
+    element.tail=tail
+
+
+class XliffSegment():
+    def __init__(self, unit_id, mid, source, target):
+        self.unit_id=unit_id
+        self.mid=mid
+        self.source=source
+        self.target=target
+
+    @property
+    def source_text(self):
+        return inline_to_string(self.source)
+
+    def has_codes(self):
+        return len(self.source)>0
+
+    def set_translation(self, text):
+        """
+        Writes a translation, given as a string with inline tags, into the target.
+        Returns False (leaving the target unchanged) if the string is not well
+        formed, or if its tags are not exactly the inline codes of the source.
+        """
+        try:
+            fragment=ET.fromstring("<segment>"+text+"</segment>")
+            # every inline code of the source must appear exactly once, otherwise
+            # the paired codes of the paragraph cannot be merged back
+            if sorted(code_key(code) for code in fragment.iter() if code is not fragment)!=sorted(inline_codes(self.source)):
+                return False
+            new=ET.Element(self.target.tag)
+            _rebuild(fragment, inline_codes(self.source), new)
+        except (ET.ParseError, ValueError):
+            return False
+        clear_content(self.target)
+        self.target.text=new.text
+        for child in list(new):
+            self.target.append(child)
+        return True
+
+    def set_plain_translation(self, text):
+        """Writes a translation as plain text, dropping all the inline codes."""
+        clear_content(self.target)
+        self.target.text=strip_tags(text)
+
+
+class XliffDocument():
+    def __init__(self, path):
+        # register the namespaces of the file, so that they are written back with the same prefixes
+        for event, (prefix, uri) in ET.iterparse(path, events=["start-ns"]):
+            ET.register_namespace(prefix, uri)
+        self.tree=ET.parse(path)
+        self.root=self.tree.getroot()
+
+    def segments(self):
+        """Returns the list of XliffSegments of all the translatable units, in document order."""
+        segments=[]
+        for file_element in self.root.iter(qname("file")):
+            target_language=file_element.get("target-language")
+            for unit in file_element.iter(qname("trans-unit")):
+                if unit.get("translate")=="no":
+                    continue
+                segments.extend(self.unit_segments(unit, target_language))
+        return segments
+
+    def unit_segments(self, unit, target_language):
+        unit_id=unit.get("id")
+        source=unit.find(qname("source"))
+        seg_source=unit.find(qname("seg-source"))
+        target=unit.find(qname("target"))
+        children=list(unit)
+
+        if seg_source is None:
+            if target is None:
+                target=self.new_target(unit, source, children.index(source)+1, target_language)
+            return [XliffSegment(unit_id, None, source, target)]
+
+        source_mrks=[mrk for mrk in seg_source.iter(qname("mrk")) if mrk.get("mtype")=="seg"]
+        target_mrks={}
+        if target is not None:
+            target_mrks={mrk.get("mid"): mrk for mrk in target.iter(qname("mrk")) if mrk.get("mtype")=="seg"}
+        if target is None or any(mrk.get("mid") not in target_mrks for mrk in source_mrks):
+            if target is not None:
+                unit.remove(target)
+            target=self.new_target(unit, seg_source, list(unit).index(seg_source)+1, target_language)
+            target_mrks={mrk.get("mid"): mrk for mrk in target.iter(qname("mrk")) if mrk.get("mtype")=="seg"}
+        return [XliffSegment(unit_id, mrk.get("mid"), mrk, target_mrks[mrk.get("mid")]) for mrk in source_mrks]
+
+    def new_target(self, unit, source, position, target_language):
+        """Creates a target as a copy of source, inserted in unit at position."""
+        target=copy.deepcopy(source)
+        target.tag=qname("target")
+        target.attrib.clear()
+        if target_language:
+            target.set(XML_LANG, target_language)
+        target.tail=source.tail
+        unit.insert(position, target)
+        return target
+
+    def save(self, path):
+        self.tree.write(path, encoding="UTF-8", xml_declaration=True)
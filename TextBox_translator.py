@@ -1,9 +1,36 @@
-import streamlit as st
-import pyperclip 
 import sys
 import random
 import requests
-import yaml
+import threading
+import xmlrpc.client
+
+
+class MTServerError(Exception):
+    """Raised when an MT server cannot be reached or returns an unusable answer."""
+    pass
+
+
+def get_url(server_type,server_IP,server_Port):
+    if server_type=="OpenNMT":
+        return "http://"+server_IP.strip()+":"+str(server_Port)+"/translator/translate"
+    elif server_type=="Moses":
+        return "http://"+server_IP.strip()+":"+str(server_Port)+"/RPC2"
+    else:
+        return "http://"+server_IP.strip()+":"+str(server_Port)+"/translate"
+
+# ServerProxy objects cannot be shared between threads, so every thread keeps
+# its own proxy per Moses server. The transport of a proxy keeps the HTTP
+# connection open between requests.
+_moses_proxies=threading.local()
+
+def get_moses_proxy(url):
+    proxies=getattr(_moses_proxies, "proxies", None)
+    if proxies is None:
+        proxies={}
+        _moses_proxies.proxies=proxies
+    if url not in proxies:
+        proxies[url]=xmlrpc.client.ServerProxy(url)
+    return proxies[url]
 
 def connect(server_type,server_IP,server_Port):
     if server_type=="MTUOC":
@@ -12,16 +39,16 @@ def connect(server_type,server_IP,server_Port):
             urlMTUOC = "http://"+server_IP.strip()+":"+str(server_Port)+"/translate"
         except:
             errormessage="Error connecting to MTUOC: \n"+ str(sys.exc_info()[1])
-            messagebox.showinfo("Error", errormessage) 
+            raise MTServerError(errormessage)
             
             
     elif server_type=="Moses":
         try:
             global proxyMoses
-            proxyMoses = xmlrpc.client.ServerProxy("http://"+connecto_E_Server.get().strip()+":"+str(connecto_E_Port.get())+"/RPC2")
+            proxyMoses = get_moses_proxy(get_url(server_type,server_IP,server_Port))
         except:
             errormessage="Error connecting to Moses: \n"+ str(sys.exc_info()[1])
-            messagebox.showinfo("Error", errormessage)      
+            raise MTServerError(errormessage)
             
     elif server_type=="OpenNMT":
         try:
@@ -29,21 +56,21 @@ def connect(server_type,server_IP,server_Port):
             urlOpenNMT = "http://"+server_IP.strip()+":"+str(server_Port)+"/translator/translate"
         except:
             errormessage="Error connecting to OpenNMT: \n"+ str(sys.exc_info()[1])
-            messagebox.showinfo("Error", errormessage)   
+            raise MTServerError(errormessage)
     elif server_type=="NMTWizard":
         try:
             global urlNMTWizard
             urlNMTWizard = "http://"+server_IP.strip()+":"+str(server_Port)+"/translate"
         except:
             errormessage="Error connecting to NMTWizard: \n"+ str(sys.exc_info()[1])
-            messagebox.showinfo("Error", errormessage)           
+            raise MTServerError(errormessage)
     elif server_type=="ModernMT":
         try:
             global urlModernMT
             urlModernMT = "http://"+server_IP.strip()+":"+str(server_Port)+"/translate"
         except:
             errormessage="Error connecting to ModernMT: \n"+ str(sys.exc_info()[1])
-            messagebox.showinfo("Error", errormessage)
+            raise MTServerError(errormessage)
             
    
    
@@ -52,9 +79,10 @@ def clear_test():
     test_text_target.delete(1.0,END)
 
 
-def translate_segment_MTUOC(segment,id=101,srcLang="en-US",tgtLang="es-ES",):
+def translate_segment_MTUOC(segment,id=101,srcLang="en-US",tgtLang="es-ES",url=None):
     import random
-    global urlMTUOC
+    if url is None:
+        url=urlMTUOC
     translation=""
     try:
         headers = {'content-type': 'application/json'}
@@ -64,80 +92,150 @@ def translate_segment_MTUOC(segment,id=101,srcLang="en-US",tgtLang="es-ES",):
         params["src"]=segment
         params["srcLang"]=srcLang
         params["tgtLang"]=tgtLang
-        response = requests.post(urlMTUOC, json=params, headers=headers)
+        response = requests.post(url, json=params, headers=headers)
         
         target = response.json()
         translation=target["tgt"]
     except:
         errormessage="Error retrieving translation from MTUOC: \n"+ str(sys.exc_info()[1])
-        messagebox.showinfo("Error", errormessage)
+        raise MTServerError(errormessage)
     return(translation)
     
-def translate_segment_OpenNMT(segment):
-    global urlOpenNMT
+def translate_segment_OpenNMT(segment,url=None):
+    if url is None:
+        url=urlOpenNMT
     translation=""
     try:
         headers = {'content-type': 'application/json'}
         params = [{ "src" : segment}]
-        response = requests.post(urlOpenNMT, json=params, headers=headers)
+        response = requests.post(url, json=params, headers=headers)
         target = response.json()
         translation=target[0][0]["tgt"]
     except:
         errormessage="Error retrieving translation from OpenNMT: \n"+ str(sys.exc_info()[1])
-        messagebox.showinfo("Error", errormessage)
+        raise MTServerError(errormessage)
     return(translation)
 
     
-def translate_segment_NMTWizard(segment):
-    global urlNMTWizard
+def translate_segment_NMTWizard(segment,url=None):
+    if url is None:
+        url=urlNMTWizard
     translation=""
     try:
         headers = {'content-type': 'application/json'}
         params={ "src": [  {"text": segment}]}
-        response = requests.post(urlNMTWizard, json=params, headers=headers)
+        response = requests.post(url, json=params, headers=headers)
         target = response.json()
         translation=target["tgt"][0][0]["text"]
     except:
         errormessage="Error retrieving translation from NMTWizard: \n"+ str(sys.exc_info()[1])
-        messagebox.showinfo("Error", errormessage)
+        raise MTServerError(errormessage)
     return(translation)
     
-def translate_segment_ModernMT(segment):
-    global urlModernMT
-    params={}
-    params['q']=segment
-    response = requests.get(urlModernMT,params=params)
-    target = response.json()
-    translation=target['data']["translation"]
+def translate_segment_ModernMT(segment,url=None):
+    if url is None:
+        url=urlModernMT
+    translation=""
+    try:
+        params={}
+        params['q']=segment
+        response = requests.get(url,params=params)
+        target = response.json()
+        translation=target['data']["translation"]
+    except:
+        errormessage="Error retrieving translation from ModernMT: \n"+ str(sys.exc_info()[1])
+        raise MTServerError(errormessage)
     return(translation)
         
-def translate_segment_Moses(segment):
-
+def translate_segment_Moses(segment,url=None):
+    if url is None:
+        proxy=proxyMoses
+    else:
+        proxy=get_moses_proxy(url)
     translation=""
     try:
         param = {"text": segment}
-        result = proxyMoses.translate(param)
+        result = proxy.translate(param)
         translation=result['text']
     except:
         errormessage="Error retrieving translation from Moses: \n"+ str(sys.exc_info()[1])
-        messagebox.showinfo("Error", errormessage)
+        raise MTServerError(errormessage)
     return(translation)
     
 def translate_segment(segment,server_type,server_IP,server_Port):
-    connect(server_type,server_IP,server_Port)
+    # The URL is computed per call instead of read from the globals set by connect(),
+    # so that several threads can translate with different engines at the same time.
+    url=get_url(server_type,server_IP,server_Port)
     if server_type=="MTUOC":
-        translation=translate_segment_MTUOC(segment)
+        translation=translate_segment_MTUOC(segment,url=url)
     elif server_type=="OpenNMT":
-        translation=translate_segment_OpenNMT(segment)
+        translation=translate_segment_OpenNMT(segment,url=url)
     elif server_type=="NMTWizard":
-        translation=translate_segment_NMTWizard(segment)
+        translation=translate_segment_NMTWizard(segment,url=url)
     elif server_type=="ModernMT":
-        translation=translate_segment_ModernMT(segment)
+        translation=translate_segment_ModernMT(segment,url=url)
     elif server_type=="Moses":
-        translation=translate_segment_Moses(segment)
+        translation=translate_segment_Moses(segment,url=url)
     translation=translation.replace("\n"," ")
     return(translation)
 
+def translate_segments_OpenNMT(segments,url):
+    translations=[]
+    try:
+        headers = {'content-type': 'application/json'}
+        params = [{ "src" : segment} for segment in segments]
+        response = requests.post(url, json=params, headers=headers)
+        target = response.json()
+        translations=[item["tgt"] for item in target[0]]
+    except:
+        errormessage="Error retrieving translation from OpenNMT: \n"+ str(sys.exc_info()[1])
+        raise MTServerError(errormessage)
+    return(translations)
+
+def translate_segments_NMTWizard(segments,url):
+    translations=[]
+    try:
+        headers = {'content-type': 'application/json'}
+        params={ "src": [{"text": segment} for segment in segments]}
+        response = requests.post(url, json=params, headers=headers)
+        target = response.json()
+        translations=[item[0]["text"] for item in target["tgt"]]
+    except:
+        errormessage="Error retrieving translation from NMTWizard: \n"+ str(sys.exc_info()[1])
+        raise MTServerError(errormessage)
+    return(translations)
+
+def translate_segments_Moses(segments,url):
+    # All the segments go in one request with system.multicall
+    translations=[]
+    try:
+        multicall = xmlrpc.client.MultiCall(get_moses_proxy(url))
+        for segment in segments:
+            multicall.translate({"text": segment})
+        translations=[result["text"] for result in multicall()]
+    except:
+        errormessage="Error retrieving translation from Moses: \n"+ str(sys.exc_info()[1])
+        raise MTServerError(errormessage)
+    return(translations)
+
+def translate_segments(segments,server_type,server_IP,server_Port):
+    # OpenNMT, NMTWizard and Moses accept several segments per request, the
+    # other protocols are translated one segment per request.
+    if not segments:
+        return([])
+    url=get_url(server_type,server_IP,server_Port)
+    if server_type=="OpenNMT":
+        translations=translate_segments_OpenNMT(segments,url)
+    elif server_type=="NMTWizard":
+        translations=translate_segments_NMTWizard(segments,url)
+    elif server_type=="Moses":
+        translations=translate_segments_Moses(segments,url)
+    else:
+        return([translate_segment(segment,server_type,server_IP,server_Port) for segment in segments])
+    if len(translations)!=len(segments):
+        raise MTServerError("Error retrieving translation from "+server_type+": \n"+"expected "+str(len(segments))+" translations, got "+str(len(translations)))
+    return([translation.replace("\n"," ") for translation in translations])
+
 
 def translate_test():
     connect()
@@ -147,6 +245,8 @@ def translate_test():
     test_text_target.insert(1.0,traduccio)
 
 def main():
+    import streamlit as st
+    import yaml
     # Text area for user input
     input_text = st.text_area("Enter text:", help="Enter the text you want to translate")
     
@@ -0,0 +1,55 @@
+from MTUOC_tag_protection import protect, restore
+
+"""
+    Tests of the protection of tags, URLs, e-mails and numbers during MT.
+    Run with: python -m pytest test_tag_protection.py
+"""
+
+SOURCE='Click <g id="1">here</g> or visit https://x.org/a. Price 1.000,5 <x id="2"/>'
+
+
+def test_protect_replaces_tags_urls_emails_and_numbers():
+    protected, originals=protect('<g id="1">Mail</g> a.b@c.org or see www.x.org, page 12')
+    assert protected=="｟0｠Mail｟1｠ ｟2｠ or see ｟3｠, page ｟4｠"
+    assert originals==['<g id="1">', "</g>", "a.b@c.org", "www.x.org", "12"]
+
+
+def test_restore_copied_placeholders():
+    protected, originals=protect(SOURCE)
+    assert restore(protected, protected, originals)==SOURCE
+
+
+def test_restore_without_protected_strings():
+    protected, originals=protect("Hello world")
+    assert restore("Hola mundo", protected, originals)=="Hola mundo"
+
+
+def test_reordered_placeholders_keep_the_order_of_the_translation():
+    protected, originals=protect("Page 3 of 10")
+    assert restore("Página ｟1｠ de ｟0｠", protected, originals)=="Página 10 de 3"
+
+
+def test_duplicated_and_unknown_placeholders_are_dropped():
+    protected, originals=protect('<x id="1"/>Hello')
+    assert restore("｟0｠Hola ｟0｠", protected, originals)=='<x id="1"/>Hola '
+    assert restore("｟0｠Hola ｟7｠", protected, originals)=='<x id="1"/>Hola '
+
+
+def test_dropped_tags_are_projected_around_words():
+    protected, originals=protect('Click <g id="1">here</g> now')
+    assert restore("Haz clic ahora", protected, originals)=='Haz <g id="1">clic</g> ahora'
+
+
+def test_dropped_urls_and_numbers_are_separated_from_words():
+    protected, originals=protect(SOURCE)
+    restored=restore("Haz clic aquí o visita. Precio", protected, originals)
+    assert "https://x.org/a Precio 1.000,5" in restored
+    assert restored.count("https://x.org/a")==1
+    protected, originals=protect("12 apples")
+    assert restore("manzanas", protected, originals)=="12 manzanas"
+
+
+def test_badly_nested_tags_are_projected_from_the_source():
+    protected, originals=protect('<g id="1">a <g id="2">b</g></g>')
+    restored=restore("｟1｠｟3｠x y｟2｠｟0｠", protected, originals)
+    assert restored=='<g id="1">x <g id="2">y</g></g>'
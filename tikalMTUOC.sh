@@ -1,2 +1,2 @@
 #!/bin/bash
-"jdk-17.0.15+6-jre/bin/java" -cp "`dirname $0`/lib/*" net.sf.okapi.applications.tikal.Main "$@"
+"jdk-17.0.15+6-jre/bin/java" $TIKAL_JAVA_OPTS -cp "`dirname $0`/lib/*" net.sf.okapi.applications.tikal.Main "$@"